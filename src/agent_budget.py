@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from langchain.agents import AgentExecutor
+from langchain.agents.format_scratchpad import format_log_to_str
+from langchain.prompts import PromptTemplate
+from langchain_core.agents import AgentFinish, AgentStep
+from concurrency import LLM_LIMIT
+from metrics import COUNT_BUCKETS, inc, observe, timed
+from retrieval import normalize_query
+from util import count_tokens, debugprint
+
+# Soft per-run budgets; when one runs out the agent is asked for a final answer instead
+# of planning another step
+AGENT_MAX_ITERATIONS = int(os.environ.get("AGENT_MAX_ITERATIONS", 6))
+AGENT_MAX_SECONDS = float(os.environ.get("AGENT_MAX_SECONDS", 90))
+AGENT_MAX_SCRATCHPAD_TOKENS = int(os.environ.get("AGENT_MAX_SCRATCHPAD_TOKENS", 8000))
+
+FINALIZE_PROMPT = PromptTemplate.from_template("""
+Answer the question using only the work done so far below; no more tools can be used. If it is not enough to answer, say so and summarize what was found.
+
+Question: {input}
+
+Work so far:
+{scratchpad}
+
+Final Answer:
+""".strip())
+
+TOOL_TIMEOUT_OBSERVATION = "The tool was stopped because the time budget ran out."
+
+# Start time and tool memo of the agent run executing in this task
+_RUN_STARTED = ContextVar("agent_run_started", default=None)
+_RUN_MEMO = ContextVar("agent_run_memo", default=None)
+
+
+def _memo_key(action):
+    return action.tool, normalize_query(str(action.tool_input))
+
+
+class BudgetedAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor with a per-run tool memo and soft budgets on steps, wall-clock time and
+    scratchpad tokens. A repeated (or, after normalize_query, near-identical) tool call in
+    the same run is answered from the memo without running the tool. Only tools in
+    memo_tools (default: all) are memoized; calling any other tool clears the memo, since
+    those change state the memoized tools may depend on. When a budget runs out, the run
+    ends with the latest answer_tool observation if no state-changing tool ran after it,
+    otherwise with one LLM call over the scratchpad. In async runs a tool call is cut off
+    when the time budget runs out; sync tool calls are only checked before the next step.
+    max_iterations / max_execution_time stay as hard limits.
+    """
+
+    llm: Any = None
+    answer_tool: Optional[str] = None
+    memo_tools: Optional[frozenset] = None
+    max_steps: int = AGENT_MAX_ITERATIONS
+    max_run_seconds: float = AGENT_MAX_SECONDS
+    max_scratchpad_tokens: int = AGENT_MAX_SCRATCHPAD_TOKENS
+    max_iterations: Optional[int] = AGENT_MAX_ITERATIONS + 2
+    max_execution_time: Optional[float] = 2 * AGENT_MAX_SECONDS
+
+    def _memoized(self, tool):
+        return self.memo_tools is None or tool in self.memo_tools
+
+    def _build_memo(self, intermediate_steps):
+        memo = {}
+        for action, observation in intermediate_steps:
+            if self._memoized(action.tool):
+                memo[_memo_key(action)] = observation
+            else:
+                memo.clear()
+        return memo
+
+    def _remaining_seconds(self):
+        started = _RUN_STARTED.get()
+        if started is None:
+            return None
+        return self.max_run_seconds - (time.monotonic() - started)
+
+    def _exhausted(self, intermediate_steps):
+        """The budget that ran out, or None."""
+        if len(intermediate_steps) >= self.max_steps:
+            return "steps"
+        remaining = self._remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            return "time"
+        if count_tokens(format_log_to_str(intermediate_steps)) >= self.max_scratchpad_tokens:
+            return "tokens"
+        return None
+
+    def _stopped(self, reason, intermediate_steps):
+        inc("rag_agent_budget_stops_total", reason=reason)
+        observe("rag_agent_steps", len(intermediate_steps), COUNT_BUCKETS)
+        debugprint(f"agent: {reason} budget exhausted after {len(intermediate_steps)} steps, finalizing")
+        for action, observation in reversed(intermediate_steps):
+            if action.tool == self.answer_tool and observation != TOOL_TIMEOUT_OBSERVATION:
+                return AgentFinish({"output": str(observation)}, f"Budget exhausted ({reason}), using the last answer")
+            if not self._memoized(action.tool):
+                break  # e.g. a later retrieval replaced the documents that answer was based on
+        return None
+
+    def _finalize_prompt(self, inputs, intermediate_steps):
+        # Most recent steps that fit the token budget
+        steps = list(intermediate_steps)
+        while len(steps) > 1 and count_tokens(format_log_to_str(steps)) > self.max_scratchpad_tokens:
+            steps.pop(0)
+        return FINALIZE_PROMPT.invoke({"input": inputs.get("input", ""), "scratchpad": format_log_to_str(steps)})
+
+    def _finish(self, response, reason):
+        text = getattr(response, "content", str(response))
+        return AgentFinish({"output": text}, f"Budget exhausted ({reason})\nFinal Answer: {text}")
+
+    def _memo_step(self, agent_action):
+        memo = _RUN_MEMO.get()
+        if memo is None or not self._memoized(agent_action.tool):
+            return None
+        observation = memo.get(_memo_key(agent_action))
+        if observation is None:
+            return None
+        inc("rag_agent_tool_memo_hits_total", tool=agent_action.tool)
+        debugprint(f"agent: reusing {agent_action.tool}({agent_action.tool_input!r}) from earlier in this run")
+        return AgentStep(action=agent_action, observation=observation)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        if not intermediate_steps:
+            _RUN_STARTED.set(time.monotonic())
+        reason = self._exhausted(intermediate_steps)
+        if reason:
+            final = self._stopped(reason, intermediate_steps)
+            if final is None:
+                with timed("agent.finalize"):
+                    response = self.llm.invoke(self._finalize_prompt(inputs, intermediate_steps))
+                final = self._finish(response, reason)
+            yield final
+            return
+        _RUN_MEMO.set(self._build_memo(intermediate_steps))
+        yield from super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager)
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        if not intermediate_steps:
+            _RUN_STARTED.set(time.monotonic())
+        reason = self._exhausted(intermediate_steps)
+        if reason:
+            final = self._stopped(reason, intermediate_steps)
+            if final is None:
+                async with LLM_LIMIT:
+                    with timed("agent.finalize"):
+                        response = await self.llm.ainvoke(self._finalize_prompt(inputs, intermediate_steps))
+                final = self._finish(response, reason)
+            yield final
+            return
+        _RUN_MEMO.set(self._build_memo(intermediate_steps))
+        async for chunk in super()._aiter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            yield chunk
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        step = self._memo_step(agent_action)
+        if step is not None:
+            return step
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        step = self._memo_step(agent_action)
+        if step is not None:
+            return step
+        action = super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        remaining = self._remaining_seconds()
+        if remaining is None:
+            return await action
+        try:
+            return await asyncio.wait_for(action, timeout=max(0.0, remaining))
+        except asyncio.TimeoutError:
+            inc("rag_agent_tool_timeouts_total", tool=agent_action.tool)
+            debugprint(f"agent: {agent_action.tool} cut off, time budget exhausted")
+            return AgentStep(action=agent_action, observation=TOOL_TIMEOUT_OBSERVATION)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from embedding_cache import normalize_text
+from lazy import LazySingleton
+from metrics import METRICS
+from util import STATE_DIR
+
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_PATH = os.path.join(STATE_DIR, "answer_cache.sqlite")
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 10_000))
+
+
+def prompt_version(*parts) -> str:
+    """Short hash of everything that shapes the prompt (template text, output schema, ...)."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Generated answers in a local SQLite file, keyed by (model, prompt version, question,
+    ordered context chunk primary keys). Entries expire after ttl seconds, the least
+    recently used are evicted beyond max_entries, and the chunk -> entry table lets the
+    indexer drop every answer built on a chunk it deletes.
+    """
+
+    def __init__(self, path: str, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # Shared with the indexer process, which invalidates entries
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answer TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS answer_chunks (pk INTEGER NOT NULL, key TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answer_chunks_pk ON answer_chunks (pk)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answer_chunks_key ON answer_chunks (key)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, version: str, question: str, chunk_ids: List) -> Optional[str]:
+        # Without a primary key for every chunk the entry couldn't be invalidated
+        if not chunk_ids or any(pk is None for pk in chunk_ids):
+            return None
+        blob = json.dumps([model, version, normalize_text(question), [int(pk) for pk in chunk_ids]])
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _delete(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM answers WHERE key IN ({marks})", batch)
+            self._conn.execute(f"DELETE FROM answer_chunks WHERE key IN ({marks})", batch)
+
+    def lookup(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._delete([key])
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def store(self, key: Optional[str], answer: str, chunk_ids: List) -> None:
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._delete([key])
+            self._conn.execute(
+                "INSERT INTO answers (key, answer, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO answer_chunks (pk, key) VALUES (?, ?)",
+                [(int(pk), key) for pk in set(chunk_ids)],
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        expired = [key for (key,) in self._conn.execute(
+            "SELECT key FROM answers WHERE created < ?", (now - self.ttl,)
+        )]
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        excess = count - len(expired) - self.max_entries
+        if excess > 0:
+            expired += [key for (key,) in self._conn.execute(
+                "SELECT key FROM answers WHERE created >= ? ORDER BY last_used LIMIT ?", (now - self.ttl, excess)
+            )]
+        self._delete(expired)
+
+    def invalidate_chunks(self, chunk_ids: List) -> int:
+        """Drop every answer whose context included one of these chunks; returns how many."""
+        ids = [int(pk) for pk in chunk_ids]
+        keys = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                keys.update(key for (key,) in self._conn.execute(
+                    f"SELECT key FROM answer_chunks WHERE pk IN ({marks})", batch
+                ))
+            self._delete(list(keys))
+            self._conn.commit()
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("DELETE FROM answer_chunks")
+            self._conn.commit()
+
+
+# Created on first use
+ANSWER_CACHE = LazySingleton("answer cache", lambda: AnswerCache(ANSWER_CACHE_PATH))
+
+
+def _cache_counts():
+    if not ANSWER_CACHE.initialized:
+        return []
+    cache = ANSWER_CACHE.get()
+    return [
+        ("rag_cache_lookups_total", {"cache": "answer", "result": "hit"}, cache.hits),
+        ("rag_cache_lookups_total", {"cache": "answer", "result": "miss"}, cache.misses),
+    ]
+
+
+METRICS.add_collector(_cache_counts)
@@ -0,0 +1,432 @@
+"""
+Offline benchmark: generates a synthetic PDF corpus and measures indexing, retrieval,
+quote verification and metadata handling with a deterministic hashing embedding, the
+NumPy vector store and a stubbed LLM (no OpenAI or Milvus needed). Results are printed
+as JSON so runs on different commits can be compared.
+
+    python3 src/benchmark.py --files 20 --pages 10 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import zlib
+
+# Everything the apps would write goes to a scratch directory, set before any imports below
+_WORKDIR = tempfile.mkdtemp(prefix="rag_benchmark_")
+os.environ.setdefault("RAG_STATE_DIR", os.path.join(_WORKDIR, "state"))
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from loadtest import StubLLM
+from numpy_store import NumpyVectorStore
+
+_WORDS = (
+    "analysis archive argument author climate community context culture data debate "
+    "design evidence experiment framework history identity inquiry language learning "
+    "literature market measure memory method model network policy practice process "
+    "research result sample school science society source structure study system "
+    "teacher theory tradition value variable voice water writing youth growth region"
+).split()
+
+
+# Synthetic corpus
+
+def _sentence(rng):
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", ",", ";"])
+
+
+def _page_lines(rng, lines=60, width=90):
+    out, line = [], ""
+    while len(out) < lines:
+        sentence = _sentence(rng)
+        if len(line) + len(sentence) + 1 > width:
+            out.append(line)
+            line = sentence
+        else:
+            line = f"{line} {sentence}".strip()
+        if rng.random() < 0.05:
+            out += [line, ""]  # paragraph break
+            line = ""
+    return out[:lines]
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages, info):
+    """Minimal single-font PDF with one text stream per page (a list of lines) and an Info dict."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        "<< " + " ".join(f"/{key} ({_pdf_escape(value)})" for key, value in info.items()) + " >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        page_ids.append(len(objects) + 1)
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects) + 2} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 4 0 R >>\n"
+            f"startxref\n{xref}\n%%EOF\n").encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_corpus(directory, files, pages, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(files):
+        info = {
+            "Title": f"A study of {rng.choice(_WORDS)} and {rng.choice(_WORDS)}",
+            "Author": f"Author {i % 7}",
+            "CreationDate": f"D:{rng.randint(1990, 2024)}0101000000",
+        }
+        # Not every file has the same metadata, like real PDFs
+        if i % 3 == 0:
+            info["Subject"] = rng.choice(_WORDS)
+        if i % 4 == 0:
+            info["Keywords"] = ", ".join(rng.sample(_WORDS, 3))
+        path = os.path.join(directory, f"synthetic_{i:04d}.pdf")
+        write_pdf(path, [_page_lines(rng) for _ in range(pages)], info)
+        paths.append(path)
+    return paths
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words embedding: each word is hashed into one signed dimension."""
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+        self.model = f"hash-{dimensions}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            h = zlib.crc32(word.strip(".,;:!?").encode("utf-8"))
+            vector[h % self.dimensions] += 1.0 if h & (1 << 31) else -1.0
+        return (vector / (np.linalg.norm(vector) or 1)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def install_stubs(store):
+    # Must run before index.py, quote.py or single.py is imported
+    sys.modules["embeddings"] = types.SimpleNamespace(EMBEDDINGS=store.embeddings)
+    sys.modules["vectorstore"] = types.SimpleNamespace(
+        VECTOR_STORE=store, drop_collection=store.drop, ensure_scalar_index=lambda: None,
+        compact_store=store.compact, doc_filter=lambda doc_ids: {"doc_ids": doc_ids},
+    )
+    sys.modules["llm"] = types.SimpleNamespace(LLM=StubLLM(0), LLM_MODEL="stub")
+
+
+# Measurements
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def latency_summary(latencies):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def bench_indexing(paths, pages_per_file, workers, store):
+    from doc_store import DOC_STORE
+    from index import collect_docs
+    from ingest import text_splitter
+    from langchain.document_loaders import PyPDFLoader
+
+    start = time.perf_counter()
+    loaded = []
+    for path in paths:
+        loaded.extend(PyPDFLoader(path).load())
+    load_seconds = time.perf_counter() - start
+    pages = len(loaded)
+
+    start = time.perf_counter()
+    split = text_splitter.split_documents(loaded)
+    split_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks, parsed, documents = collect_docs(paths, workers)
+    collect_seconds = time.perf_counter() - start
+    files_pages = len(parsed) * pages_per_file
+    for doc_id, metadata in documents.items():
+        DOC_STORE.put(doc_id, metadata)
+
+    texts = [chunk.page_content for chunk in chunks]
+    start = time.perf_counter()
+    vectors = store.embeddings.embed_documents(texts)
+    embed_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(0, len(texts), 256):
+        store.add_embeddings(texts[i:i + 256], vectors[i:i + 256], [c.metadata for c in chunks[i:i + 256]])
+    insert_seconds = time.perf_counter() - start
+
+    return {
+        "pages": pages,
+        "chunks": len(chunks),
+        "load_pages_per_s": round(pages / load_seconds, 1),
+        "split_chunks_per_s": round(len(split) / split_seconds, 1),
+        "collect_docs_pages_per_s": round(files_pages / collect_seconds, 1),
+        "collect_docs_chunks_per_s": round(len(chunks) / collect_seconds, 1),
+        "collect_docs_workers": workers,
+        "fake_embed_chunks_per_s": round(len(texts) / embed_seconds, 1),
+        "insert_chunks_per_s": round(len(texts) / insert_seconds, 1),
+    }, chunks
+
+
+def sample_queries(chunks, n, rng):
+    queries = set()
+    while len(queries) < n:
+        words = rng.choice(chunks).page_content.split()
+        start = rng.randrange(max(1, len(words) - 10))
+        queries.add(" ".join(words[start:start + 10]))
+    return list(queries)
+
+
+async def _time_calls(fn, inputs):
+    latencies = []
+    for item in inputs:
+        start = time.perf_counter()
+        await fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+async def bench_retrieval(queries):
+    import quote
+    import single
+
+    # Disjoint query sets, so one node's runs don't warm the retrieval cache for the next
+    n = len(queries) // 3
+    quote_queries, single_queries, graph_queries = queries[:n], queries[n:2 * n], queries[2 * n:]
+    return {
+        "quote.retrieve": await _time_calls(lambda q: quote.retrieve({"question": q}), quote_queries),
+        "single.retrieve": await _time_calls(lambda q: single.retrieve({"question": q}), single_queries),
+        "quote.retrieve_cached": await _time_calls(lambda q: quote.retrieve({"question": q}), quote_queries),
+        "quote.graph_stub_llm": await _time_calls(lambda q: quote.graph.ainvoke({"question": q}), graph_queries),
+    }
+
+
+def bench_verify(chunks, n, rng):
+    from langchain_core.documents import Document
+    from util import verify_quote_in_source
+    from verify import QuoteVerifier
+
+    cases = []
+    for _ in range(n):
+        text = rng.choice(chunks).page_content
+        words = text.split()
+        start = rng.randrange(max(1, len(words) - 12))
+        quote = " ".join(words[start:start + 12])
+        if rng.random() < 0.5:
+            # Not in the source: one word replaced
+            quote_words = quote.split()
+            quote_words[len(quote_words) // 2] = "zzzz"
+            quote = " ".join(quote_words)
+        cases.append((quote, text))
+
+    start = time.perf_counter()
+    found = sum(verify_quote_in_source(quote, text) for quote, text in cases)
+    seconds = time.perf_counter() - start
+
+    verifier = QuoteVerifier()
+    docs = {text: [Document(page_content=text)] for _, text in cases}
+    start = time.perf_counter()
+    indexed_found = sum(verifier.verify(quote, docs[text]).verified for quote, text in cases)
+    indexed_seconds = time.perf_counter() - start
+
+    return {
+        "quotes": n,
+        "verify_quote_in_source_per_s": round(n / seconds, 1),
+        "verify_quote_in_source_verified": found,
+        "quote_verifier_per_s": round(n / indexed_seconds, 1),
+        "quote_verifier_verified": indexed_found,
+    }
+
+
+# (search_dim, quantization) layouts compared against the exact float32 scan
+COMPRESSION_LAYOUTS = [(None, "float16"), (None, "int8"), (512, "float16"), (512, "int8"), (256, "int8")]
+
+
+def bench_compression(chunks, queries, dimensions, rerank_factors):
+    embeddings = HashEmbeddings(dimensions)
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = embeddings.embed_documents(texts)
+    query_vectors = embeddings.embed_documents(queries)
+    metadatas = [{} for _ in texts]
+
+    def build(name, **layout):
+        store = NumpyVectorStore(embeddings, os.path.join(_WORKDIR, "compression", name), **layout)
+        store.add_embeddings(texts, vectors, metadatas)
+        return store
+
+    exact_store = build("exact")
+    exact = [{pk for pk, _ in exact_store._top_k(vector, 5)} for vector in query_vectors]
+    results = []
+    for search_dim, quantization in COMPRESSION_LAYOUTS:
+        store = build(f"{search_dim}_{quantization}", search_dim=search_dim, quantization=quantization)
+        scale_bytes = 4 if quantization == "int8" else 0
+        for rerank_factor in rerank_factors:
+            store.rerank_factor = rerank_factor
+            latencies, found = [], 0
+            for vector, truth in zip(query_vectors, exact):
+                start = time.perf_counter()
+                hits = store._top_k(vector, 5)
+                latencies.append(time.perf_counter() - start)
+                found += len(truth & {pk for pk, _ in hits})
+            results.append({
+                "search_dim": store.search_dim,
+                "quantization": quantization,
+                "rerank_factor": rerank_factor,
+                "recall_at_5": round(found / (5 * len(queries)), 4),
+                "first_stage_bytes_per_vector": store._search_itemsize() + scale_bytes,
+                "search": latency_summary(latencies),
+            })
+    exact_latencies = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        exact_store._top_k(vector, 5)
+        exact_latencies.append(time.perf_counter() - start)
+    return {
+        "dimensions": dimensions,
+        "exact_bytes_per_vector": 4 * dimensions,
+        "exact_search": latency_summary(exact_latencies),
+        "layouts": results,
+    }
+
+
+def bench_metadata(chunks, n, rng):
+    from doc_store import DOC_STORE, attach_metadata
+    from langchain_core.documents import Document
+
+    def hits():
+        return [Document(page_content="", metadata=dict(rng.choice(chunks).metadata)) for _ in range(5)]
+
+    # Joining from SQLite, then from the in-memory cache
+    DOC_STORE.get()._cache.clear()
+    cold = []
+    for _ in range(n):
+        docs = hits()
+        start = time.perf_counter()
+        attach_metadata(docs)
+        cold.append(time.perf_counter() - start)
+        DOC_STORE.get()._cache.clear()
+    warm = []
+    for _ in range(n):
+        docs = hits()
+        start = time.perf_counter()
+        attach_metadata(docs)
+        warm.append(time.perf_counter() - start)
+
+    chunk_bytes = sum(len(json.dumps(chunk.metadata)) for chunk in chunks)
+    docs = [Document(page_content="", metadata=dict(chunk.metadata)) for chunk in chunks]
+    attach_metadata(docs)
+    joined_bytes = sum(len(json.dumps(doc.metadata)) for doc in docs)
+    return {
+        "chunk_metadata_bytes": chunk_bytes,
+        "denormalized_metadata_bytes": joined_bytes,
+        "join_top5_cold": latency_summary(cold),
+        "join_top5_warm": latency_summary(warm),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    paths = make_corpus(os.path.join(_WORKDIR, "data"), args.files, args.pages, args.seed)
+    store = NumpyVectorStore(HashEmbeddings(args.dimensions), os.path.join(_WORKDIR, "numpy_store"))
+    install_stubs(store)
+
+    indexing, chunks = bench_indexing(paths, args.pages, args.workers, store)
+    queries = sample_queries(chunks, args.queries, rng)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "indexing": indexing,
+        "retrieval": asyncio.run(bench_retrieval(queries)),
+        "compression": bench_compression(chunks, queries, args.compression_dimensions, args.rerank_factors),
+        "verify": bench_verify(chunks, args.quotes, rng),
+        "metadata": bench_metadata(chunks, args.joins, rng),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline indexing/retrieval benchmark on a synthetic corpus")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="pages per file")
+    parser.add_argument("--workers", type=int, default=1, help="collect_docs parse workers")
+    parser.add_argument("--queries", type=int, default=300, help="retrieval queries (split over the nodes)")
+    parser.add_argument("--quotes", type=int, default=2000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--compression-dimensions", type=int, default=1024,
+                        help="embedding size for the truncation/quantization recall comparison")
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 4, 10],
+                        help="first-stage candidates per result to re-rank at full precision")
+    parser.add_argument("--joins", type=int, default=2000, help="document metadata joins of 5 hits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    # Progress output of the code under test goes to stderr, the results to stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run(args)
+    finally:
+        if args.keep:
+            print(f"Scratch directory kept at {_WORKDIR}", file=sys.stderr)
+        else:
+            shutil.rmtree(_WORKDIR, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
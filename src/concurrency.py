@@ -0,0 +1,25 @@
+import asyncio
+import os
+
+# Caps on outbound calls made from the async request path, shared by every
+# session in the process so one burst can't exhaust provider or Milvus capacity.
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", 16))
+VECTOR_CONCURRENCY = int(os.environ.get("VECTOR_CONCURRENCY", 32))
+
+LLM_LIMIT = asyncio.Semaphore(LLM_CONCURRENCY)
+VECTOR_LIMIT = asyncio.Semaphore(VECTOR_CONCURRENCY)
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second (for use from a single event loop)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
@@ -0,0 +1,125 @@
+import os
+from typing import List, NamedTuple
+
+from langchain_core.documents import Document
+from util import count_tokens, extract_year
+
+# Prompt tokens available for retrieved context
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+
+_MIN_OVERLAP = 20
+_MAX_OVERLAP = 400
+
+
+class PackedContext(NamedTuple):
+    text: str
+    sources: List[Document]  # one per "Source ID", in order
+    tokens: int
+    naive_tokens: int  # what one header + snippet per chunk would have cost
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.naive_tokens - self.tokens)
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if too short to trust)."""
+    for k in range(min(len(a), len(b), _MAX_OVERLAP), _MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _merge(pieces: List[str], text: str) -> None:
+    """Add text to the non-overlapping pieces of one page, merging where chunks overlap."""
+    for i, piece in enumerate(pieces):
+        if text in piece:
+            return
+        if piece in text:
+            pieces[i] = text
+            return
+        k = _overlap(piece, text)
+        if k:
+            pieces[i] = piece + text[k:]
+            return
+        k = _overlap(text, piece)
+        if k:
+            pieces[i] = text + piece[k:]
+            return
+    pieces.append(text)
+
+
+def _file_name(doc: Document) -> str:
+    return os.path.basename(doc.metadata.get("source", "") or "")
+
+
+def _doc_header(doc: Document) -> str:
+    return (
+        f"File Name: {_file_name(doc)}\n"
+        f"Article Title: {doc.metadata.get('title', 'Untitled')}\n"
+        f"Author: {doc.metadata.get('author', 'Unknown')}\n"
+        f"Year: {extract_year(doc.metadata.get('creationdate', ''))}"
+    )
+
+
+def _page(doc: Document) -> int:
+    return int(doc.metadata.get("page", 0))
+
+
+def naive_tokens(docs: List[Document]) -> int:
+    # The per-chunk layout the apps used before packing
+    return sum(
+        count_tokens(f"{_doc_header(doc)}\nPage Number: {_page(doc) + 1}\nArticle Snippet: {doc.page_content}")
+        for doc in docs
+    )
+
+
+def pack_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> PackedContext:
+    """
+    Build the prompt context from ranked chunks (best first, as search/amulti_search return them):
+    - chunks are taken best first while they fit in the token budget
+    - adjacent/overlapping chunks from the same source and page are merged
+    - title/author/year are printed once per document, followed by its pages
+    Each merged page section gets a Source ID; sources[i] is the Document for Source ID i.
+    """
+    # source -> page -> merged pieces, in first-selected order
+    selected = {}
+    first_doc = {}
+    used = 0
+    for doc in docs:
+        text = doc.page_content
+        source = doc.metadata.get("source", "")
+        pieces = list(selected.get(source, {}).get(_page(doc), []))
+        before = sum(len(piece) for piece in pieces)
+        _merge(pieces, text)
+        added = sum(len(piece) for piece in pieces) - before
+        if not added:
+            continue  # already fully covered by an overlapping chunk
+
+        # Only pay for the text merging actually added, plus any new headers
+        cost = count_tokens(text) * added // max(1, len(text))
+        if source not in selected:
+            cost += count_tokens(_doc_header(doc))
+        if len(pieces) > len(selected.get(source, {}).get(_page(doc), [])):
+            cost += 8  # Source ID / page line
+        if used + cost > budget and selected:
+            continue
+        used += cost
+        selected.setdefault(source, {})[_page(doc)] = pieces
+        first_doc.setdefault(source, doc)
+
+    sections = []
+    sources = []
+    for source, pages in selected.items():
+        doc = first_doc[source]
+        lines = [_doc_header(doc)]
+        for page in sorted(pages):
+            for piece in pages[page]:
+                lines.append(f"Source ID: {len(sources)} (Page Number: {page + 1})\n{piece}")
+                metadata = {key: value for key, value in doc.metadata.items() if key != "pk"}
+                metadata["page"] = page
+                sources.append(Document(page_content=piece, metadata=metadata))
+        sections.append("\n\n".join(lines))
+
+    text = "\n\n" + "\n\n---\n\n".join(sections)
+    return PackedContext(text, sources, count_tokens(text), naive_tokens(docs))
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from lazy import LazySingleton
+from util import STATE_DIR
+
+DOC_STORE_PATH = os.path.join(STATE_DIR, "documents.sqlite")
+
+# What every chunk in the vector store carries; everything else lives in the document table
+CHUNK_FIELDS = {"doc_id": "str", "source": "str", "page": "int"}
+
+
+class DocumentStore:
+    """
+    PDF-level metadata (title, author, creationdate, ...) stored once per document in
+    SQLite, keyed by doc_id (derived from the file's content hash). Chunks only carry
+    doc_id, source and page; the metadata is joined back onto search hits. doc_ids are
+    content-addressed, so entries never change and can be cached in memory for good.
+    """
+
+    def __init__(self, path: str, max_cached: int = 4096):
+        self.path = path
+        self.max_cached = max_cached
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        # Written by the indexer, read by the apps
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, metadata TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put(self, doc_id: str, metadata: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, metadata) VALUES (?, ?)",
+                (doc_id, json.dumps(metadata)),
+            )
+            self._conn.commit()
+
+    def get_many(self, doc_ids: Iterable[str]) -> Dict[str, dict]:
+        found = {}
+        missing = []
+        with self._lock:
+            for doc_id in set(doc_ids):
+                if doc_id in self._cache:
+                    self._cache.move_to_end(doc_id)
+                    found[doc_id] = self._cache[doc_id]
+                else:
+                    missing.append(doc_id)
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for doc_id, metadata in self._conn.execute(
+                    f"SELECT doc_id, metadata FROM documents WHERE doc_id IN ({marks})", batch
+                ):
+                    found[doc_id] = self._cache[doc_id] = json.loads(metadata)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return found
+
+    def all(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, metadata FROM documents").fetchall()
+        return {doc_id: json.loads(metadata) for doc_id, metadata in rows}
+
+    def delete(self, doc_ids: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+            self._conn.commit()
+            for doc_id in doc_ids:
+                self._cache.pop(doc_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+            self._cache.clear()
+
+
+def doc_id_for(file_hash: str) -> str:
+    return file_hash[:32]
+
+
+def document_metadata(page_metadata: dict) -> dict:
+    """The document-level part of a loader page's metadata (source is kept for filtering)."""
+    return {key: value for key, value in page_metadata.items() if key not in ("page", "page_label")}
+
+
+def attach_metadata(docs) -> None:
+    """Join document metadata onto search hits, in place (chunk fields take precedence)."""
+    metadata = DOC_STORE.get_many(doc.metadata["doc_id"] for doc in docs if "doc_id" in doc.metadata)
+    for doc in docs:
+        doc_metadata = metadata.get(doc.metadata.get("doc_id"))
+        if doc_metadata:
+            doc.metadata = {**doc_metadata, **doc.metadata}
+
+
+# Created on first use
+DOC_STORE = LazySingleton("document store", lambda: DocumentStore(DOC_STORE_PATH))
@@ -0,0 +1,134 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, List
+
+from util import count_tokens, debugprint
+
+# Status codes worth retrying besides 429
+_TRANSIENT_STATUS = {408, 409, 500, 502, 503, 504}
+_TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "InternalServerError", "ServiceUnavailableError"}
+
+
+def _status_code(e):
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    return status
+
+
+def _is_rate_limit(e):
+    return _status_code(e) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _is_transient(e):
+    return (
+        _status_code(e) in _TRANSIENT_STATUS
+        or type(e).__name__ in _TRANSIENT_ERRORS
+        or isinstance(e, (asyncio.TimeoutError, ConnectionError))
+    )
+
+
+def _retry_after(e):
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingScheduler:
+    """
+    Packs texts into requests by token budget and embeds them with a bounded number
+    of requests in flight. A 429 pauses every request until the backoff expires, so
+    the scheduler settles just under the provider's rate limit instead of hammering it.
+
+    embed_fn is any async function mapping a list of texts to a list of vectors,
+    e.g. OpenAIEmbeddings().aembed_documents or a stub.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 1000,
+        max_in_flight: int = 4,
+        max_retries: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.tokens = 0
+        self._semaphore = None
+        self._resume_at = 0.0
+
+    def pack(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into batches under the token and size limits."""
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens
+                            or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+            self.tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _wait_for_cooldown(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            await self._wait_for_cooldown()
+            async with self._semaphore:
+                await self._wait_for_cooldown()
+                try:
+                    self.requests += 1
+                    return await self.embed_fn(texts)
+                except Exception as e:
+                    rate_limited = _is_rate_limit(e)
+                    if not (rate_limited or _is_transient(e)) or attempt >= self.max_retries:
+                        raise
+                    delay = _retry_after(e)
+                    if delay is None:
+                        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                        delay *= random.uniform(0.5, 1.0)
+                    if rate_limited:
+                        # Pause everyone, not just this request
+                        self.rate_limited += 1
+                        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                    attempt += 1
+                    self.retries += 1
+                    debugprint(f"Embedding request failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+            if not rate_limited:
+                await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        batches = self.pack(texts)
+        results = await asyncio.gather(
+            *(self._embed_batch([texts[i] for i in batch]) for batch in batches)
+        )
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
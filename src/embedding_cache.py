@@ -0,0 +1,176 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that keeps vectors in a local SQLite file.
+
+    Entries are keyed by (model, dimensions, hash of normalized text) and stored as
+    float32 blobs. When the file grows past max_bytes, least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, underlying: Embeddings, path: str, max_bytes: int = 2 << 30):
+        self.underlying = underlying
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        model = getattr(underlying, "model", type(underlying).__name__)
+        dimensions = getattr(underlying, "dimensions", None)
+        self._namespace = f"{model}|{dimensions}|"
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._stored_bytes()
+
+    def _stored_bytes(self) -> int:
+        (size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        return size
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return self._namespace + digest
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        unique = list(set(keys))
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items: dict) -> None:
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            # Rows that are replaced (e.g. stored by a concurrent miss) don't add to the size
+            replaced = 0
+            keys = list(items)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                (length,) = self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchone()
+                replaced += length
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._size += sum(len(blob) for _, blob, _ in rows) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        size = self._stored_bytes()
+        # Trim down to 90% so we don't evict on every insert
+        excess = size - int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        )
+        doomed = []
+        for key, length in rows:
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= length
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._conn.commit()
+        self._size = self._stored_bytes()
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _split(self, texts: List[str]):
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self._count(len(texts) - len(missing), len(missing))
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new = dict(zip(missing.keys(), vectors))
+            self._store(new)
+            found.update(new)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self._lookup([key])
+        if key in found:
+            self._count(1, 0)
+            return found[key]
+        self._count(0, 1)
+        vector = self.underlying.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    async def aembed_documents(self, texts: List[str], embed_fn=None) -> List[List[float]]:
+        # embed_fn overrides how cache misses are embedded, e.g. EmbeddingScheduler.embed
+        keys, found, missing = self._split(texts)
+        if missing:
+            embed_fn = embed_fn or self.underlying.aembed_documents
+            vectors = await embed_fn(list(missing.values()))
+            new = dict(zip(missing.keys(), vectors))
+            self._store(new)
+            found.update(new)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self._lookup([key])
+        if key in found:
+            self._count(1, 0)
+            return found[key]
+        self._count(0, 1)
+        vector = await self.underlying.aembed_query(text)
+        self._store({key: vector})
+        return vector
@@ -1,5 +1,42 @@
+import os
+
+from embedding_cache import CachedEmbeddings
+from http_clients import HTTP_ASYNC_CLIENT, HTTP_CLIENT
 from langchain_openai import OpenAIEmbeddings
+from lazy import LazySingleton
+from metrics import METRICS
+from util import STATE_DIR
 
 _MODEL = "text-embedding-3-large"
+_CACHE_PATH = os.path.join(STATE_DIR, "embedding_cache.sqlite")
+_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 2 << 30))
+
+
+def _create_embeddings():
+    return CachedEmbeddings(
+        OpenAIEmbeddings(
+            model=_MODEL,
+            api_key=_API_KEY,
+            http_client=HTTP_CLIENT.get(),
+            http_async_client=HTTP_ASYNC_CLIENT.get(),
+        ),
+        path=_CACHE_PATH,
+        max_bytes=_CACHE_MAX_BYTES,
+    )
+
+
+# Created on first use
+EMBEDDINGS = LazySingleton("embeddings", _create_embeddings)
+
+
+def _cache_counts():
+    if not EMBEDDINGS.initialized:
+        return []
+    cache = EMBEDDINGS.get()
+    return [
+        ("rag_cache_lookups_total", {"cache": "embedding", "result": "hit"}, cache.hits),
+        ("rag_cache_lookups_total", {"cache": "embedding", "result": "miss"}, cache.misses),
+    ]
+
 
-EMBEDDINGS = OpenAIEmbeddings(model=_MODEL, api_key=_API_KEY)
\ No newline at end of file
+METRICS.add_collector(_cache_counts)
@@ -0,0 +1,21 @@
+import os
+
+import httpx
+from lazy import LazySingleton
+
+# One keep-alive connection pool shared by the embedding model and the LLM
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 64))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 32))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 60))
+
+
+def _limits():
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+HTTP_CLIENT = LazySingleton(
+    "HTTP client", lambda: httpx.Client(limits=_limits(), timeout=HTTP_TIMEOUT)
+)
+HTTP_ASYNC_CLIENT = LazySingleton(
+    "async HTTP client", lambda: httpx.AsyncClient(limits=_limits(), timeout=HTTP_TIMEOUT)
+)
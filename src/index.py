@@ -1,42 +1,331 @@
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from util import pad_fields, rename_fields
-from vectorstore import VECTOR_STORE, drop_collection
+from answer_cache import ANSWER_CACHE
+from doc_store import CHUNK_FIELDS, DOC_STORE, doc_id_for
+from embed_scheduler import EmbeddingScheduler
+from embeddings import EMBEDDINGS
+from ingest import parse_pdfs
+from metrics import METRICS_ENABLED, inc, timed, write_metrics
+from util import STATE_DIR, bump_index_version, debugprint
+from vectorstore import VECTOR_STORE, compact_store, drop_collection, ensure_scalar_index
 
+import argparse
+import asyncio
 import glob
+import hashlib
+import json
+import os
+import queue
+import threading
 
-def collect_docs():
+PDF_GLOB = "data/*.pdf"
+MANIFEST_PATH = os.path.join(STATE_DIR, "index_manifest.json")
+# Batches committed since the manifest was last compacted, one JSON line each
+JOURNAL_PATH = os.path.join(STATE_DIR, "index_journal.jsonl")
+
+_DONE = object()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest():
+    """
+    Manifest layout:
+    {"fields": {name: type name} (chunk fields in the collection, see CHUNK_FIELDS),
+     "files": {path: {"hash": sha256, "ids": [primary keys], "done": bool}}}
+    A file with "done": false was interrupted part way; its "ids" are the chunks
+    inserted so far.
+    """
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+
+    # Replay batches committed by an interrupted run
+    if os.path.exists(JOURNAL_PATH):
+        with open(JOURNAL_PATH) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn write at the end of the journal
+                apply_journal_entry(manifest, entry)
+        save_manifest(manifest)
+    return manifest
+
+
+def save_manifest(manifest):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_PATH)
+    if os.path.exists(JOURNAL_PATH):
+        os.remove(JOURNAL_PATH)
+
+
+def apply_journal_entry(manifest, entry):
+    if "fields" in entry:
+        manifest["fields"] = entry["fields"]
+    files = manifest["files"]
+    for path, digest, ids in entry.get("added", []):
+        record = files.setdefault(path, {"hash": digest, "ids": [], "done": False})
+        record["ids"].extend(ids)
+    for path, digest in entry.get("done", []):
+        files.setdefault(path, {"hash": digest, "ids": []})["done"] = True
+
+
+def commit_batch(manifest, journal, entry):
+    apply_journal_entry(manifest, entry)
+    journal.write(json.dumps(entry) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def collect_docs(pdf_files=None, workers=1):
     """
-    Collecting and Loading documents
+    Collecting, Loading and Splitting documents
+    Returns the chunks, the files that parsed successfully and {doc_id: document metadata}.
     """
 
-    PDF_GLOB = "data/*.pdf"
-    pdf_files = glob.glob(PDF_GLOB)
-    pdf_docs = []
-    for path in pdf_files:
-        loader = PyPDFLoader(path)
-        pages = loader.load()        
-        pdf_docs.extend(pages)      
+    if pdf_files is None:
+        pdf_files = sorted(glob.glob(PDF_GLOB))
+    chunks = []
+    parsed = []
+    documents = {}
+    for path, metadata, file_chunks in parse_pdfs(pdf_files, workers):
+        doc_id = doc_id_for(file_hash(path))
+        for chunk in file_chunks:
+            chunk.metadata = {"doc_id": doc_id, **chunk.metadata}
+        chunks.extend(file_chunks)
+        parsed.append(path)
+        documents[doc_id] = metadata
+    return chunks, parsed, documents
+
+
+def _run_stage(target, out_queue):
+    # Run a pipeline stage in a thread; errors are forwarded downstream
+    def run():
+        try:
+            target()
+        except BaseException as e:
+            out_queue.put(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _get(in_queue):
+    item = in_queue.get()
+    if isinstance(item, BaseException):
+        raise item
+    return item
+
+
+def produce_batches(pdf_files, manifest, hashes, workers, batch_size, out_queue):
+    """
+    Load and split, storing each file's metadata in the document table, and emit
+    batches of at most batch_size chunks that reference it by doc_id.
+    Each batch is (chunks, done) where done lists the files whose last chunk is in the batch.
+    """
+    files = manifest["files"]
+    batch, done = [], []
+    for path, metadata, chunks in parse_pdfs(pdf_files, workers):
+        # Stored before any chunk is inserted, so no search hit lacks its metadata
+        doc_id = doc_id_for(hashes[path])
+        DOC_STORE.put(doc_id, metadata)
+        for chunk in chunks:
+            chunk.metadata = {"doc_id": doc_id, **chunk.metadata}
+
+        # Resume a file that was interrupted part way; splitting is deterministic
+        skip = len(files[path]["ids"]) if path in files else 0
+        for chunk in chunks[skip:]:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                out_queue.put((batch, done))
+                batch, done = [], []
+        done.append(path)
+    if batch or done:
+        out_queue.put((batch, done))
+    out_queue.put(_DONE)
+
+
+async def _embed(texts, scheduler):
+    with timed("index.embed_batch"):
+        return await EMBEDDINGS.aembed_documents(texts, embed_fn=scheduler.embed)
+
+
+async def _embed_batches(scheduler, in_queue, out_queue):
+    # Keep several batches embedding at once, but hand them on in order
+    loop = asyncio.get_running_loop()
+    pending = []
+    while True:
+        item = await loop.run_in_executor(None, _get, in_queue)
+        if item is _DONE:
+            break
+        chunks, done = item
+        texts = [chunk.page_content for chunk in chunks]
+        task = asyncio.create_task(_embed(texts, scheduler))
+        pending.append((chunks, done, task))
+        while len(pending) > scheduler.max_in_flight:
+            chunks, done, task = pending.pop(0)
+            await loop.run_in_executor(None, out_queue.put, (chunks, await task, done))
+    for chunks, done, task in pending:
+        await loop.run_in_executor(None, out_queue.put, (chunks, await task, done))
+
+
+def embed_batches(scheduler, in_queue, out_queue):
+    asyncio.run(_embed_batches(scheduler, in_queue, out_queue))
+    print(f"Embedding: {scheduler.requests} requests, {scheduler.tokens} tokens, "
+          f"{scheduler.rate_limited} rate limited, {scheduler.retries} retries")
+    inc("rag_embedding_requests_total", scheduler.requests)
+    inc("rag_embedding_tokens_total", scheduler.tokens)
+    inc("rag_embedding_retries_total", scheduler.retries)
+    out_queue.put(_DONE)
+
+
+def index_files(pdf_files, manifest, hashes, workers=1, batch_size=256, queue_depth=4, scheduler=None):
+    """
+    Streaming pipeline: parse/split (process pool) -> metadata -> embed -> insert.
+    Bounded queues between the stages keep memory proportional to batch_size, and
+    every inserted batch is committed to the journal so an interrupted run can resume.
+    """
+    if scheduler is None:
+        scheduler = EmbeddingScheduler(EMBEDDINGS.underlying.aembed_documents)
+    chunk_queue = queue.Queue(maxsize=queue_depth)
+    vector_queue = queue.Queue(maxsize=queue_depth)
+    _run_stage(lambda: produce_batches(pdf_files, manifest, hashes, workers, batch_size, chunk_queue), chunk_queue)
+    _run_stage(lambda: embed_batches(scheduler, chunk_queue, vector_queue), vector_queue)
+
+    added = 0
+    fields_committed = False
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(JOURNAL_PATH, "a") as journal:
+        while True:
+            item = _get(vector_queue)
+            if item is _DONE:
+                break
+            chunks, vectors, done = item
+            ids = []
+            if chunks:
+                with timed("index.insert_batch"):
+                    ids = VECTOR_STORE.add_embeddings(
+                        texts=[chunk.page_content for chunk in chunks],
+                        embeddings=vectors,
+                        metadatas=[chunk.metadata for chunk in chunks],
+                    )
+                inc("rag_indexed_chunks_total", len(ids))
+            entry = {"added": [], "done": [[path, hashes[path]] for path in done]}
+            if not fields_committed:
+                entry["fields"] = manifest["fields"]
+                fields_committed = True
+            by_file = {}
+            for chunk, pk in zip(chunks, ids):
+                by_file.setdefault(chunk.metadata["source"], []).append(pk)
+            for path, file_ids in by_file.items():
+                entry["added"].append([path, hashes[path], file_ids])
+            commit_batch(manifest, journal, entry)
+            bump_index_version()
+            if ids:
+                added += len(ids)
+                print(f"Inserted batch of {len(ids)} chunks ({added} total)")
+    save_manifest(manifest)
+    return added
+
+
+def rebuild(workers=1, batch_size=256, scheduler=None):
+    pdf_files = sorted(glob.glob(PDF_GLOB))
+    hashes = {path: file_hash(path) for path in pdf_files}
+
+    drop_collection()
+    bump_index_version()
+    ANSWER_CACHE.clear()
+    DOC_STORE.clear()
+    manifest = {"fields": CHUNK_FIELDS, "files": {}}
+    save_manifest(manifest)
+    added = index_files(pdf_files, manifest, hashes, workers, batch_size, scheduler=scheduler)
+    ensure_scalar_index()
+    print(f"Added {added} text chunks to vector store")
+
+
+def update(manifest, workers=1, batch_size=256, scheduler=None):
+    pdf_files = sorted(glob.glob(PDF_GLOB))
+    hashes = {path: file_hash(path) for path in pdf_files}
+    files = manifest["files"]
+
+    stale = [path for path, entry in files.items() if hashes.get(path) != entry["hash"]]
+    pending = [path for path in pdf_files
+               if path not in files or path in stale or not files[path].get("done", True)]
+
+    # Remove chunks of deleted and modified files by primary key
+    stale_ids = [pk for path in stale for pk in files[path]["ids"]]
+    if stale_ids:
+        VECTOR_STORE.delete(ids=stale_ids)
+        bump_index_version()
+        dropped = ANSWER_CACHE.invalidate_chunks(stale_ids)
+        debugprint(f"Invalidated {dropped} cached answers")
+        reclaimed = compact_store()
+        if reclaimed:
+            debugprint(f"Compacted {reclaimed} deleted rows out of the vector store")
+    stale_docs = {doc_id_for(files[path]["hash"]) for path in stale}
+    for path in stale:
+        del files[path]
+    # Identical files share a doc_id; keep documents something still points at
+    stale_docs -= {doc_id_for(entry["hash"]) for entry in files.values()}
+    stale_docs -= {doc_id_for(hashes[path]) for path in pending}
+    DOC_STORE.delete(list(stale_docs))
+    save_manifest(manifest)
+    print(f"Removed {len(stale_ids)} text chunks from {len(stale)} stale files")
 
-    pad_fields(pdf_docs)
-    rename_fields(pdf_docs)
-    return pdf_docs
+    if not pending:
+        print("Index is up to date")
+        return
 
-# Collect documents
-all_docs = collect_docs()
+    resumed = sum(1 for path in pending if path in files)
+    if resumed:
+        debugprint(f"Resuming {resumed} partially indexed files")
+    added = index_files(pending, manifest, hashes, workers, batch_size, scheduler=scheduler)
+    ensure_scalar_index()
+    print(f"Added {added} text chunks from {len(pending)} new or changed files")
 
-# Preprocessing and Indexing
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=100,
-    separators=["\n\n", "\n", ".", " ", ""]
-)
-chunks = text_splitter.split_documents(all_docs)
-print(f"Split {len(chunks)} text chunks")
 
-drop_collection()
-added = VECTOR_STORE.add_documents(chunks)
-print(f"Added {len(added)} text chunks to vector store")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index data/*.pdf into the vector store")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="drop the collection and re-embed every PDF")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of processes used to parse and split PDFs")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="chunks per insert batch")
+    parser.add_argument("--max-in-flight", type=int, default=4,
+                        help="concurrent embedding requests")
+    parser.add_argument("--max-batch-tokens", type=int, default=100_000,
+                        help="token budget per embedding request")
+    args = parser.parse_args()
 
+    scheduler = EmbeddingScheduler(
+        EMBEDDINGS.underlying.aembed_documents,
+        max_batch_tokens=args.max_batch_tokens,
+        max_in_flight=args.max_in_flight,
+    )
 
+    manifest = load_manifest()
+    if not args.rebuild and manifest is None:
+        print("No index manifest found, doing a full rebuild")
+    elif not args.rebuild and manifest.get("fields") != CHUNK_FIELDS:
+        # Chunks from before the document table carry all PDF metadata themselves
+        print("Index uses an older chunk layout, doing a full rebuild")
+        manifest = None
+    if args.rebuild or manifest is None:
+        rebuild(args.workers, args.batch_size, scheduler)
+    else:
+        update(manifest, args.workers, args.batch_size, scheduler)
 
+    if METRICS_ENABLED:
+        metrics_path = os.path.join(STATE_DIR, "index_metrics.prom")
+        write_metrics(metrics_path)
+        print(f"Wrote indexing metrics to {metrics_path}")
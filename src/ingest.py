@@ -0,0 +1,88 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from doc_store import document_metadata
+from langchain_core.documents import Document
+from metrics import inc, stage_seconds
+from util import debugprint
+
+import time
+
+# Parsing helpers live here rather than in index.py so worker processes
+# don't import the vector store.
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=100,
+    separators=["\n\n", "\n", ".", " ", ""]
+)
+
+
+def parse_pdf(path):
+    """
+    Load and split one PDF.
+    Returns (path, document metadata, [(page_content, chunk metadata), ...], pages, seconds, error).
+    Chunk metadata is only source and page; the PDF-level fields are returned once.
+    """
+    start = time.perf_counter()
+    try:
+        pages = PyPDFLoader(path).load()
+        metadata = document_metadata(pages[0].metadata) if pages else {}
+        for page in pages:
+            page.metadata = {"source": page.metadata.get("source", path), "page": page.metadata.get("page", 0)}
+        chunks = text_splitter.split_documents(pages)
+    except Exception as e:
+        return path, {}, [], 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    records = [(chunk.page_content, chunk.metadata) for chunk in chunks]
+    return path, metadata, records, len(pages), time.perf_counter() - start, None
+
+
+def _bounded_map(executor, fn, items, window):
+    # Like executor.map, but only keeps `window` results in flight so a slow
+    # consumer doesn't let parsed files pile up in memory
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def parse_pdfs(paths, workers=1):
+    """
+    Parse and split PDFs, using a process pool when workers > 1.
+    Yields (path, document metadata, [Document, ...]) in the order of paths; files that
+    fail to parse are skipped.
+    """
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = _bounded_map(executor, parse_pdf, paths, window=workers * 2)
+    else:
+        executor = None
+        results = map(parse_pdf, paths)
+
+    start = time.perf_counter()
+    total_pages = total_chunks = failed = 0
+    try:
+        for path, metadata, records, pages, seconds, error in results:
+            if error is not None:
+                failed += 1
+                inc("rag_index_parse_errors_total")
+                debugprint(f"Skipping {path}: {error}")
+                continue
+            total_pages += pages
+            total_chunks += len(records)
+            stage_seconds("index.parse_file", seconds)
+            inc("rag_indexed_pages_total", pages)
+            print(f"Parsed {path}: {pages} pages, {len(records)} chunks in {seconds:.2f}s")
+            yield path, metadata, [Document(page_content=text, metadata=chunk_metadata)
+                                   for text, chunk_metadata in records]
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {len(paths) - failed}/{len(paths)} files ({total_pages} pages, "
+          f"{total_chunks} chunks) in {elapsed:.2f}s with {workers} worker(s)")
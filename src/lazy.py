@@ -0,0 +1,91 @@
+import functools
+import inspect
+import threading
+import time
+
+from util import debugprint
+
+# name -> seconds spent creating each singleton, for readiness/cold-start reporting
+COLD_STARTS = {}
+
+
+class LazySingleton:
+    """
+    Stand-in for a module-level client (EMBEDDINGS, LLM, VECTOR_STORE) that is only
+    created on first use, once, even with concurrent first callers. Attribute access is
+    forwarded to the real object, so call sites keep using it like the object itself.
+
+    If should_reconnect is given, method calls that fail with an error it accepts drop
+    the instance so the next call creates a fresh one. Methods named in retry_methods
+    are then retried once; only list idempotent (read) methods there, since a failed
+    write may have been partly applied.
+    """
+
+    def __init__(self, name, factory, should_reconnect=None, retry_methods=()):
+        self._name = name
+        self._factory = factory
+        self._should_reconnect = should_reconnect
+        self._retry_methods = frozenset(retry_methods)
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = self._factory()
+                    COLD_STARTS[self._name] = time.perf_counter() - start
+                    debugprint(f"Initialized {self._name} in {COLD_STARTS[self._name]:.2f}s")
+                instance = self._instance
+        return instance
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def reset(self, stale=None):
+        with self._lock:
+            # Don't throw away an instance another caller already re-created
+            if stale is None or self._instance is stale:
+                self._instance = None
+
+    def __getattr__(self, name):
+        instance = self.get()
+        value = getattr(instance, name)
+        if self._should_reconnect is None or not callable(value):
+            return value
+
+        if inspect.iscoroutinefunction(value):
+            @functools.wraps(value)
+            async def call_async(*args, **kwargs):
+                try:
+                    return await value(*args, **kwargs)
+                except Exception as e:
+                    if not self._should_reconnect(e):
+                        raise
+                    self.reset(instance)
+                    if name not in self._retry_methods:
+                        raise
+                    debugprint(f"Reconnecting {self._name} after {type(e).__name__}: {e}")
+                    return await getattr(self.get(), name)(*args, **kwargs)
+            return call_async
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            try:
+                return value(*args, **kwargs)
+            except Exception as e:
+                if not self._should_reconnect(e):
+                    raise
+                self.reset(instance)
+                if name not in self._retry_methods:
+                    raise
+                debugprint(f"Reconnecting {self._name} after {type(e).__name__}: {e}")
+                return getattr(self.get(), name)(*args, **kwargs)
+        return call
+
+    def __repr__(self):
+        state = "initialized" if self.initialized else "not initialized"
+        return f"<LazySingleton {self._name} ({state})>"
@@ -1,5 +1,19 @@
+from http_clients import HTTP_ASYNC_CLIENT, HTTP_CLIENT
 from langchain.chat_models import init_chat_model
+from lazy import LazySingleton
 
-_MODEL = "gpt-4.1-mini"
+LLM_MODEL = "gpt-4.1-mini"
 
-LLM = init_chat_model(model=_MODEL, model_provider="openai", api_key=_API_KEY)
\ No newline at end of file
+
+def _create_llm():
+    return init_chat_model(
+        model=LLM_MODEL,
+        model_provider="openai",
+        api_key=_API_KEY,
+        http_client=HTTP_CLIENT.get(),
+        http_async_client=HTTP_ASYNC_CLIENT.get(),
+    )
+
+
+# Created on first use
+LLM = LazySingleton("LLM", _create_llm)
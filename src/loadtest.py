@@ -0,0 +1,113 @@
+"""
+Load test for the async request path of quote.py, with a stubbed LLM, embedding
+model and vector store (no network). Each simulated session sends its questions one
+after another; with a non-blocking request path, throughput should grow with the
+number of concurrent sessions until LLM_CONCURRENCY is reached.
+
+    python3 src/loadtest.py --sessions 1 2 4 8 16 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import types
+
+# Unique questions below, but make sure the semantic cache tier can't kick in either
+os.environ.setdefault("RETRIEVAL_CACHE_THRESHOLD", "2")
+# Answers cached by an earlier run would skip the stubbed LLM
+os.environ.setdefault("ANSWER_CACHE", "0")
+
+from langchain_core.documents import Document
+
+
+class StubEmbeddings:
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(0.005)
+        return self.embed_query(text)
+
+
+class StubVectorStore:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, **kwargs):
+        await asyncio.sleep(self.latency)
+        return [
+            Document(
+                page_content=f"Snippet {i} about the question.",
+                metadata={"source": "data/stub.pdf", "page": i, "title": "Stub",
+                          "author": "Author", "creationdate": "2020-01-01", "pk": i},
+            )
+            for i in range(k)
+        ]
+
+
+class StubStructuredLLM:
+    def __init__(self, schema, latency):
+        self.schema = schema
+        self.latency = latency
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.schema(answer="A stubbed answer.", citations=[], sources=[])
+
+
+class StubLLM:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def with_structured_output(self, schema, **kwargs):
+        return StubStructuredLLM(schema, self.latency)
+
+
+def install_stubs(llm_latency, store_latency):
+    # Must run before quote.py (and what it imports) is loaded
+    sys.modules["llm"] = types.SimpleNamespace(LLM=StubLLM(llm_latency), LLM_MODEL="stub")
+    sys.modules["embeddings"] = types.SimpleNamespace(EMBEDDINGS=StubEmbeddings())
+    sys.modules["vectorstore"] = types.SimpleNamespace(VECTOR_STORE=StubVectorStore(store_latency),
+                                                       doc_filter=lambda doc_ids: {})
+
+
+async def session(graph, session_id, requests, latencies):
+    for i in range(requests):
+        start = time.perf_counter()
+        await graph.ainvoke({"question": f"session {session_id} question {i}"})
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(graph, sessions, requests):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(session(graph, s, requests, latencies) for s in range(sessions)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "sessions": sessions,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test with stubbed services")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=10, help="requests per session")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--store-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    install_stubs(args.llm_latency, args.store_latency)
+    from quote import graph
+
+    async def main():
+        # One event loop for every run: the concurrency limits bind to it
+        for sessions in args.sessions:
+            print(await run(graph, sessions, args.requests))
+
+    asyncio.run(main())
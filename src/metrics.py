@@ -0,0 +1,219 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Off by default; when off, instrument() returns functions unchanged and the
+# helpers below return after one flag check
+METRICS_ENABLED = os.environ.get("METRICS", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """
+    Counters and histograms by (name, labels). Collectors are callables run at export
+    time that return [(name, labels, value), ...] for counters kept elsewhere (e.g. cache
+    hit counts), so the hot path doesn't pay for them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def _collected(self):
+        values = {}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    values[(name, tuple(sorted(labels.items())))] = value
+            except Exception:
+                continue  # e.g. a cache that hasn't been created yet
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()
+            }
+        counters.update(self._collected())
+        return counters, histograms
+
+    def to_json(self):
+        counters, histograms = self.snapshot()
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": count,
+                    "sum": round(total, 6),
+                    "buckets": dict(zip([str(b) for b in buckets] + ["+Inf"], counts)),
+                }
+                for (name, labels), (buckets, counts, total, count) in sorted(histograms.items())
+            ],
+        }
+
+    def to_prometheus(self):
+        counters, histograms = self.snapshot()
+        lines = []
+        typed = set()
+
+        def label_str(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{label_str(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{label_str(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{label_str(labels)} {total}")
+            lines.append(f"{name}_count{label_str(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+
+
+def inc(name, value=1, **labels):
+    if METRICS_ENABLED:
+        METRICS.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    if METRICS_ENABLED:
+        METRICS.observe(name, value, buckets, **labels)
+
+
+def stage_seconds(stage, seconds):
+    if METRICS_ENABLED:
+        METRICS.observe("rag_stage_seconds", seconds, stage=stage)
+
+
+class _Timer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        METRICS.observe("rag_stage_seconds", time.perf_counter() - self.start, stage=self.stage)
+        if exc_type is not None:
+            METRICS.inc("rag_stage_errors_total", stage=self.stage)
+
+
+_NULL_TIMER = nullcontext()
+
+
+def timed(stage):
+    """Context manager recording the block's latency under rag_stage_seconds{stage=...}."""
+    return _Timer(stage) if METRICS_ENABLED else _NULL_TIMER
+
+
+def instrument(stage):
+    """Decorator timing every call of a sync or async function (graph nodes, agent tools)."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                with _Timer(stage):
+                    return await fn(*args, **kwargs)
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed_sync(*args, **kwargs):
+            with _Timer(stage):
+                return fn(*args, **kwargs)
+        return timed_sync
+    return decorate
+
+
+def write_metrics(path):
+    """Write the Prometheus text export to a file (e.g. for a node_exporter textfile collector)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(METRICS.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def mount_metrics_endpoint():
+    """Serve /metrics (Prometheus text) and /metrics.json from the Chainlit server."""
+    if not METRICS_ENABLED:
+        return
+    from chainlit.server import app
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    if any(getattr(route, "path", None) == "/metrics" for route in app.router.routes):
+        return  # several app modules call this
+
+    async def metrics():
+        return PlainTextResponse(METRICS.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+    async def metrics_json():
+        return JSONResponse(METRICS.to_json())
+
+    app.add_api_route("/metrics", metrics, methods=["GET"])
+    app.add_api_route("/metrics.json", metrics_json, methods=["GET"])
+    # Chainlit serves its frontend from a catch-all route; ours must come before it
+    routes = app.router.routes
+    routes.insert(0, routes.pop())
+    routes.insert(0, routes.pop())
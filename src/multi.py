@@ -1,24 +1,46 @@
+import functools
 import chainlit as cl
 from langchain.agents import create_react_agent, tool
 # from langgraph.checkpoint.memory import InMemorySaver
 from langchain_core.prompts import PromptTemplate
 from llm import LLM
-from vectorstore import VECTOR_STORE
+from retrieval import amulti_search, asearch, split_queries
+from search_filter import parse_filters
+from readiness import NOT_READY_MESSAGE, acheck_ready
+from metrics import COUNT_BUCKETS, instrument, mount_metrics_endpoint, observe
+from util import debugprint
 from langchain_core.agents import AgentAction, AgentFinish
-from langchain.agents import AgentExecutor
+from agent_budget import BudgetedAgentExecutor
 
 # Moving onto Agentic RAG
 @tool(response_format="content")
+@instrument("multi.retrieve")
 async def retrieve(q: str):
-    """Retrieve information related to a query."""
+    """Retrieve information related to a query. Append source:FILE, author:NAME or year:YYYY / year:YYYY-YYYY to search only matching documents."""
 
-    retrieved_docs = VECTOR_STORE.similarity_search(q, k = 5)
+    query, filters = parse_filters(q)
+    retrieved_docs = await asearch(query, k=5, filters=filters)
+    observe("rag_retrieved_chunks", len(retrieved_docs), COUNT_BUCKETS, app="multi")
+    return format_docs(retrieved_docs)
+
+
+@tool(response_format="content")
+@instrument("multi.retrieve_many")
+async def retrieve_many(queries: str):
+    """Retrieve information for several sub-queries at once, e.g. one per side of a comparison. Input: the sub-queries separated by " | ", optionally followed by source:, author: or year: filters that apply to all of them."""
+
+    text, filters = parse_filters(queries)
+    retrieved_docs = await amulti_search(split_queries(text), k=5, limit=10, filters=filters)
+    observe("rag_retrieved_chunks", len(retrieved_docs), COUNT_BUCKETS, app="multi")
+    return format_docs(retrieved_docs)
+
+
+def format_docs(docs):
     doc_strings = [
         f"## Source: {doc.metadata}\n### Content: {doc.page_content}"
-        for doc in retrieved_docs
+        for doc in docs
     ]
-    context = "\n\n".join(doc_strings)
-    return context
+    return "\n\n".join(doc_strings)
 
 
 # ReAct prompt setup
@@ -45,11 +67,25 @@ Question: {input}
 REACT_PROMPT = PromptTemplate.from_template(REACT_PROMPT_TEMPLATE)
 
 # MEMORY = InMemorySaver()
-AGENT = create_react_agent(LLM, [retrieve], REACT_PROMPT)
-agent_executor = AgentExecutor(agent=AGENT, tools=[retrieve], verbose=True, handle_parsing_errors=True)
+# Built on first use, so importing this module doesn't create the LLM
+@functools.cache
+def get_agent_executor():
+    tools = [retrieve, retrieve_many]
+    agent = create_react_agent(LLM, tools, REACT_PROMPT)
+    return BudgetedAgentExecutor(agent=agent, tools=tools, llm=LLM, verbose=True, handle_parsing_errors=True)
+
+
+mount_metrics_endpoint()
 
 
 # Chainlink
+@cl.on_chat_start
+async def on_chat_start():
+    ready, problems = await acheck_ready()
+    if not ready:
+        debugprint(f"multi: not ready: {problems}")
+        await cl.Message(content=NOT_READY_MESSAGE).send()
+
 @cl.on_message
 async def on_message(message: cl.Message):
     config = {"configurable": {"thread_id": cl.context.session.id}}
@@ -58,7 +94,7 @@ async def on_message(message: cl.Message):
         "input": message.content,
     }
 
-    async for step in agent_executor.astream(user_input, config=config):
+    async for step in get_agent_executor().astream(user_input, config=config):
         if hasattr(step, "log"):
             await cl.Message(content=step.log).send()
         elif hasattr(step, "return_values"):
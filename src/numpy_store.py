@@ -0,0 +1,384 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+QUANTIZATIONS = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+# Rows scored per step of a compressed scan, bounding the float32 temporaries
+_SCAN_BLOCK = 1 << 16
+
+
+def compress(vectors: np.ndarray, search_dim: int, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    First-stage form of normalized vectors: the first search_dim components (Matryoshka
+    truncation), renormalized, then quantized. int8 uses a symmetric per-row scale,
+    returned alongside (None for the float types).
+    """
+    vectors = vectors[:, :search_dim].astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+    if quantization != "int8":
+        return vectors.astype(QUANTIZATIONS[quantization]), None
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Single-node vector store kept in a directory:
+      vectors.f32  normalized float32 vectors, memory-mapped, one row per chunk
+      ids.i64      primary key of each row
+      alive.u8     0 for deleted rows
+      meta.sqlite  text and metadata by primary key
+      header.json  dimension, row count, capacity and search layout
+    Search is a brute-force cosine scan (one matrix-vector product) with argpartition top-k.
+    Results carry their primary key in metadata["pk"], like the Milvus store.
+    delete() only clears alive; compact() reclaims the dead rows.
+
+    With search_dim and/or quantization set, the scan runs over a compressed copy instead:
+      search.bin   first search_dim components, renormalized, as float16 or int8
+      scales.f32   per-row int8 scale
+    and the top k * rerank_factor candidates are re-scored against vectors.f32, which
+    then only has those rows paged in. The layout is fixed when the store is created;
+    an existing store keeps the one in its header until it is dropped.
+    """
+
+    def __init__(self, embedding_function: Embeddings, path: str, search_dim: Optional[int] = None,
+                 quantization: str = "float32", rerank_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization {quantization!r}, expected one of {list(QUANTIZATIONS)}")
+        self.embedding_function = embedding_function
+        self.path = path
+        self._layout = {"search_dim": search_dim or None, "quantization": quantization}
+        self.rerank_factor = max(1, rerank_factor)
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._header_path = os.path.join(path, "header.json")
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "pk INTEGER PRIMARY KEY AUTOINCREMENT, row INTEGER NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        # Filtered searches look rows up by doc_id
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (json_extract(metadata, '$.doc_id'))"
+        )
+        self._conn.commit()
+        self._header_mtime = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    # Storage
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if os.path.exists(self._header_path):
+            with open(self._header_path) as f:
+                header = json.load(f)
+            self._header_mtime = os.stat(self._header_path).st_mtime_ns
+        else:
+            header = {"dim": None, "count": 0, "capacity": 0, **self._layout}
+        self.dim = header["dim"]
+        self.count = header["count"]
+        self.capacity = header["capacity"]
+        # Stores written before compressed search existed have no layout in the header
+        self.search_dim = header.get("search_dim")
+        self.quantization = header.get("quantization", "float32")
+        self._map()
+
+    @property
+    def compressed(self) -> bool:
+        return self.search_dim is not None or self.quantization != "float32"
+
+    def _search_itemsize(self):
+        return self.search_dim * np.dtype(QUANTIZATIONS[self.quantization]).itemsize
+
+    def _map(self):
+        self._search = self._scales = None
+        if not self.capacity:
+            self._vectors = self._ids = self._alive = None
+            return
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+",
+                                  shape=(self.capacity, self.dim))
+        self._ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r+", shape=(self.capacity,))
+        self._alive = np.memmap(self._file("alive.u8"), dtype=np.uint8, mode="r+", shape=(self.capacity,))
+        if self.compressed:
+            self._search = np.memmap(self._file("search.bin"), dtype=QUANTIZATIONS[self.quantization], mode="r+",
+                                     shape=(self.capacity, self.search_dim))
+            if self.quantization == "int8":
+                self._scales = np.memmap(self._file("scales.f32"), dtype=np.float32, mode="r+",
+                                         shape=(self.capacity,))
+
+    def _save_header(self):
+        for array in (self._vectors, self._ids, self._alive, self._search, self._scales):
+            if array is not None:
+                array.flush()
+        tmp_path = self._header_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                       "search_dim": self.search_dim, "quantization": self.quantization}, f)
+        os.replace(tmp_path, self._header_path)
+        self._header_mtime = os.stat(self._header_path).st_mtime_ns
+
+    def _refresh(self):
+        # Pick up rows written by another process (e.g. the indexer)
+        try:
+            mtime = os.stat(self._header_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._header_mtime:
+            with self._lock:
+                self._load()
+
+    def _grow(self, needed):
+        capacity = max(1024, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        self._vectors = self._ids = self._alive = self._search = self._scales = None
+        files = [("vectors.f32", 4 * self.dim), ("ids.i64", 8), ("alive.u8", 1)]
+        if self.compressed:
+            files.append(("search.bin", self._search_itemsize()))
+            if self.quantization == "int8":
+                files.append(("scales.f32", 4))
+        for name, itemsize in files:
+            with open(self._file(name), "ab") as f:
+                f.truncate(capacity * itemsize)
+        self.capacity = capacity
+        self._map()
+
+    # VectorStore API
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[int]:
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                if self.compressed:
+                    self.search_dim = min(self.search_dim or self.dim, self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            start = self.count
+            end = start + len(texts)
+            if end > self.capacity:
+                self._grow(end)
+
+            cur = self._conn.cursor()
+            ids = []
+            for offset, (text, metadata) in enumerate(zip(texts, metadatas)):
+                cur.execute("INSERT INTO chunks (row, text, metadata) VALUES (?, ?, ?)",
+                            (start + offset, text, json.dumps(metadata)))
+                ids.append(cur.lastrowid)
+            self._vectors[start:end] = vectors
+            if self.compressed:
+                self._search[start:end], scales = compress(vectors, self.search_dim, self.quantization)
+                if scales is not None:
+                    self._scales[start:end] = scales
+            self._ids[start:end] = ids
+            self._alive[start:end] = 1
+            self.count = end
+            self._conn.commit()
+            self._save_header()
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[int]:
+        texts = list(texts)
+        embeddings = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas)
+
+    def delete(self, ids: Optional[List[int]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            self._refresh()
+            ids = [int(pk) for pk in ids]
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = [row for (row,) in self._conn.execute(
+                    f"SELECT row FROM chunks WHERE pk IN ({marks})", batch)]
+                if rows:
+                    self._alive[rows] = 0
+                self._conn.execute(f"DELETE FROM chunks WHERE pk IN ({marks})", batch)
+            self._conn.commit()
+            self._save_header()
+        return True
+
+    def compact(self, min_dead_fraction: float = 0.0) -> int:
+        """
+        Rewrite the files without deleted rows once at least min_dead_fraction of the rows
+        are dead; primary keys are kept. Returns the number of rows reclaimed.
+        """
+        with self._lock:
+            self._refresh()
+            if not self.count:
+                return 0
+            keep = np.flatnonzero(self._alive[:self.count])
+            dead = self.count - len(keep)
+            if not dead or dead < min_dead_fraction * self.count:
+                return 0
+            capacity = 1024
+            while capacity < len(keep):
+                capacity *= 2
+            arrays = [("vectors.f32", self._vectors), ("ids.i64", self._ids), ("alive.u8", self._alive),
+                      ("search.bin", self._search), ("scales.f32", self._scales)]
+            arrays = [(name, array) for name, array in arrays if array is not None]
+            for name, array in arrays:
+                out = np.memmap(self._file(name + ".tmp"), dtype=array.dtype, mode="w+",
+                                shape=(capacity,) + array.shape[1:])
+                for start in range(0, len(keep), _SCAN_BLOCK):
+                    rows = keep[start:start + _SCAN_BLOCK]
+                    out[start:start + len(rows)] = array[rows]
+                out.flush()
+                del out
+            self._conn.executemany("UPDATE chunks SET row = ? WHERE pk = ?",
+                                   ((row, int(pk)) for row, pk in enumerate(self._ids[keep])))
+            self._vectors = self._ids = self._alive = self._search = self._scales = None
+            for name, _ in arrays:
+                os.replace(self._file(name + ".tmp"), self._file(name))
+            self.count = len(keep)
+            self.capacity = capacity
+            self._map()
+            self._conn.commit()
+            self._save_header()
+        return dead
+
+    def drop(self):
+        with self._lock:
+            self._vectors = self._ids = self._alive = self._search = self._scales = None
+            for name in ("vectors.f32", "ids.i64", "alive.u8", "search.bin", "scales.f32", "header.json"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM sqlite_sequence WHERE name = 'chunks'")
+            self._conn.commit()
+            self._header_mtime = None
+            self._load()
+
+    def _first_stage_scores(self, search, scales, count, query):
+        query = query[:self.search_dim].copy()
+        query /= np.linalg.norm(query) or 1
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, _SCAN_BLOCK):
+            end = min(start + _SCAN_BLOCK, count)
+            scores[start:end] = search[start:end].astype(np.float32) @ query
+        if scales is not None:
+            scores *= scales[:count]
+        return scores
+
+    def _rows(self, doc_ids: List[str], count: int) -> np.ndarray:
+        rows = []
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                batch = list(doc_ids[start:start + 500])
+                marks = ",".join("?" * len(batch))
+                rows.extend(row for (row,) in self._conn.execute(
+                    f"SELECT row FROM chunks WHERE json_extract(metadata, '$.doc_id') IN ({marks})", batch))
+        rows = np.array(sorted(rows), dtype=np.int64)
+        return rows[rows < count]
+
+    def _top_k(self, embedding: List[float], k: int, doc_ids: Optional[List[str]] = None) -> List[Tuple[int, float]]:
+        self._refresh()
+        with self._lock:
+            count, vectors, ids, alive = self.count, self._vectors, self._ids, self._alive
+            search, scales = self._search, self._scales
+        if not count:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        if doc_ids is not None:
+            # Filtered: score only the matching rows, at full precision
+            rows = self._rows(doc_ids, count)
+            rows = rows[alive[rows] != 0]
+            exact = vectors[rows] @ query
+            top = np.argsort(-exact)[:k]
+            return [(int(ids[rows[i]]), float(exact[i])) for i in top]
+        if search is None:
+            scores = vectors[:count] @ query
+        else:
+            scores = self._first_stage_scores(search, scales, count, query)
+        scores[alive[:count] == 0] = -np.inf
+        k = min(k, count)
+        if search is not None:
+            # Re-rank the first-stage candidates with the full-precision vectors
+            candidates = min(k * self.rerank_factor, count)
+            rows = np.argpartition(-scores, candidates - 1)[:candidates]
+            rows = np.sort(rows[scores[rows] != -np.inf])
+            exact = vectors[rows] @ query
+            top = np.argsort(-exact)[:k]
+            return [(int(ids[rows[i]]), float(exact[i])) for i in top]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[row]), float(scores[row])) for row in top if scores[row] != -np.inf]
+
+    def _documents(self, hits: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        if not hits:
+            return []
+        marks = ",".join("?" * len(hits))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT pk, text, metadata FROM chunks WHERE pk IN ({marks})", [pk for pk, _ in hits]
+            ).fetchall()
+        by_pk = {pk: (text, metadata) for pk, text, metadata in rows}
+        results = []
+        for pk, score in hits:
+            if pk not in by_pk:
+                continue
+            text, metadata = by_pk[pk]
+            metadata = json.loads(metadata)
+            metadata["pk"] = pk
+            results.append((Document(page_content=text, metadata=metadata), score))
+        return results
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, doc_ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self._documents(self._top_k(embedding, k, doc_ids))
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        path: str = "numpy_store",
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding, path)
+        store.add_texts(texts, metadatas)
+        return store
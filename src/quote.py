@@ -1,15 +1,29 @@
+import json
+import os
+import time
 from typing import Annotated, TypedDict
-from llm import LLM
+from llm import LLM, LLM_MODEL
 from langchain.prompts import PromptTemplate
-from vectorstore import VECTOR_STORE
+from retrieval import asearch
+from search_filter import SearchFilter, parse_filters
+from concurrency import LLM_LIMIT
 from langgraph.graph import StateGraph, START
 from langchain.schema.runnable import Runnable
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List
 from langchain_core.documents import Document
-from util import extract_year, verify_quote_in_source
+from langchain_core.utils.json import parse_partial_json
+from answer_cache import ANSWER_CACHE, ANSWER_CACHE_ENABLED, prompt_version
+from context import CONTEXT_TOKEN_BUDGET, pack_context
+from metrics import COUNT_BUCKETS, instrument, mount_metrics_endpoint, observe, stage_seconds, timed
+from util import count_tokens, debugprint
+from verify import VERIFIER, format_citations
+from readiness import NOT_READY_MESSAGE, acheck_ready
 import chainlit as cl
 
+# Stream the answer token by token instead of waiting for the whole structured output
+STREAMING = os.environ.get("QUOTE_STREAMING", "1") == "1"
+
 
 # RAG
 PROMPT = """
@@ -70,39 +84,126 @@ class QuotedAnswer(BaseModel):
     ]
 
 
+# Cached answers are only reused while the prompt, answer schema and context budget are unchanged
+PROMPT_VERSION = prompt_version(PROMPT.template, QuotedAnswer.model_json_schema(), CONTEXT_TOKEN_BUDGET)
+
+
 class State(TypedDict):
     question: str
+    filters: SearchFilter
     context: List[Document]
     answer: QuotedAnswer
     formatted: str
 
 
 
-def format_docs_with_id(docs: List[Document]) -> str:
-    formatted = [
-        f"File Name: {doc.metadata.get('source').split('/')[1]}\n"
-        f"Article Title: {doc.metadata.get('title', 'Untitled')}\n"
-        f"Author: {doc.metadata.get('author', 'Unknown')}\n"
-        f"Page Number: {int(doc.metadata.get('page', 0)) + 1}\n"
-        f"Year: {extract_year(doc.metadata.get('creationdate', ''))}\n"
-        f"Article Snippet: {doc.page_content}"
-        for i, doc in enumerate(docs)
-    ] 
-    for i, doc in enumerate(docs): print(doc.metadata)
-    return "\n\n" + "\n\n".join(formatted)
+def build_context(docs: List[Document]):
+    with timed("quote.build_context"):
+        packed = pack_context(docs)
+    observe("rag_context_tokens", packed.tokens, COUNT_BUCKETS, app="quote")
+    debugprint(f"quote: context {packed.tokens} prompt tokens for {len(docs)} chunks "
+               f"({packed.saved_tokens} saved by packing)")
+    # Index the sources for quote verification before the LLM call
+    VERIFIER.prepare(packed.sources)
+    return packed
+
+
+def cached_answer(state):
+    """Returns (cache key or None, cached QuotedAnswer or None) for this question and context."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    chunk_ids = [doc.metadata.get("pk") for doc in state["context"]]
+    key = ANSWER_CACHE.key(LLM_MODEL, PROMPT_VERSION, state["question"], chunk_ids)
+    cached = ANSWER_CACHE.lookup(key) if key else None
+    if cached is None:
+        return key, None
+    debugprint("quote: answer cache hit")
+    return key, QuotedAnswer.model_validate_json(cached)
+
 
+def cache_answer(key, state, response: QuotedAnswer):
+    if key:
+        chunk_ids = [doc.metadata["pk"] for doc in state["context"]]
+        ANSWER_CACHE.store(key, response.model_dump_json(), chunk_ids)
 
-def retrieve(state):
-    results = VECTOR_STORE.similarity_search(state["question"], k=5)
-    return {"context": results}
 
-def generate(state):
-    formatted_docs = format_docs_with_id(state["context"])
-    messages = PROMPT.invoke({"question": state["question"], "context": formatted_docs})
-    structured_llm = LLM.with_structured_output(QuotedAnswer)
-    response = structured_llm.invoke(messages)
-    return {"answer": response, "formatted": formatted_docs}
+@instrument("quote.retrieve")
+async def retrieve(state):
+    # Inline filters (source:, author:, year:) scope the search and are dropped from the question
+    question, filters = parse_filters(state["question"])
+    if state.get("filters"):
+        filters = state["filters"].merged(filters)
+    results = await asearch(question, k=5, filters=filters)
+    observe("rag_retrieved_chunks", len(results), COUNT_BUCKETS, app="quote")
+    return {"question": question, "context": results}
 
+@instrument("quote.generate")
+async def generate(state):
+    packed = build_context(state["context"])
+    key, response = cached_answer(state)
+    if response is None:
+        messages = PROMPT.invoke({"question": state["question"], "context": packed.text})
+        structured_llm = LLM.with_structured_output(QuotedAnswer)
+        async with LLM_LIMIT:
+            with timed("quote.llm"):
+                response = await structured_llm.ainvoke(messages)
+        observe("rag_answer_tokens", count_tokens(response.answer), COUNT_BUCKETS, app="quote")
+        cache_answer(key, state, response)
+    # Citation source IDs refer to the packed sources
+    return {"answer": response, "formatted": packed.text, "context": packed.sources}
+
+
+
+@instrument("quote.generate")
+async def stream_generate(state, msg: cl.Message):
+    """
+    Like generate, but streams the `answer` field into msg while the structured output
+    is still being produced. The tool-call arguments arrive as JSON fragments, which are
+    parsed incrementally; whatever has been added to `answer` since the last chunk is sent.
+    If the arguments end up incomplete or invalid, falls back to generate() and replaces
+    whatever was streamed with its answer.
+    """
+    prefix = msg.content
+    packed = build_context(state["context"])
+    key, response = cached_answer(state)
+    if response is not None:
+        await msg.stream_token(response.answer)
+        return {"answer": response, "formatted": packed.text, "context": packed.sources}, time.perf_counter()
+
+    messages = PROMPT.invoke({"question": state["question"], "context": packed.text})
+    tool_llm = LLM.bind_tools([QuotedAnswer], tool_choice="QuotedAnswer")
+
+    args_json = ""
+    streamed = ""
+    first_token_at = None
+    async with LLM_LIMIT:
+        with timed("quote.llm"):
+            async for chunk in tool_llm.astream(messages):
+                for tool_chunk in chunk.tool_call_chunks:
+                    args_json += tool_chunk.get("args") or ""
+                partial = parse_partial_json(args_json) if args_json else None
+                answer = partial.get("answer") if isinstance(partial, dict) else None
+                if isinstance(answer, str) and len(answer) > len(streamed) and answer.startswith(streamed):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    await msg.stream_token(answer[len(streamed):])
+                    streamed = answer
+
+    try:
+        response = QuotedAnswer.model_validate(json.loads(args_json))
+    except (json.JSONDecodeError, ValidationError) as e:
+        # e.g. the stream was cut off (finish_reason=length)
+        debugprint(f"quote: streamed answer unusable ({type(e).__name__}), retrying without streaming")
+        result = await generate(state)
+        msg.content = prefix + result["answer"].answer
+        await msg.update()
+        return result, first_token_at or time.perf_counter()
+    if response.answer.startswith(streamed):
+        # Flush anything the partial parser held back (e.g. a trailing escape)
+        await msg.stream_token(response.answer[len(streamed):])
+    observe("rag_answer_tokens", count_tokens(response.answer), COUNT_BUCKETS, app="quote")
+    cache_answer(key, state, response)
+    return {"answer": response, "formatted": packed.text, "context": packed.sources}, first_token_at
 
 
 # Compile application and test
@@ -110,42 +211,66 @@ graph_builder = StateGraph(State).add_sequence([retrieve, generate])
 graph_builder.add_edge(START, "retrieve")
 graph = graph_builder.compile()
 
+mount_metrics_endpoint()
+
 
 # Chainlit integration
 @cl.on_chat_start
 async def on_chat_start():
+    # Clients are created here on first use rather than at import; report failures
+    ready, problems = await acheck_ready()
+    if not ready:
+        debugprint(f"quote: not ready: {problems}")
+        await cl.Message(content=NOT_READY_MESSAGE).send()
+        return
     await cl.Message(content="Hi! Ask a question and I’ll answer it with sources based on the provided documents.").send()
 
-@cl.on_message
-async def on_message(message: cl.Message):
-    question = message.content
+async def answer_streaming(question):
+    start = time.perf_counter()
+    msg = cl.Message(content="")
+    await msg.stream_token("**Answer:** ")
     state = {"question": question}
+    state.update(await retrieve(state))
     try:
-        response = graph.invoke(state)
-        quoted_answer = response["answer"]
-        formatted_docs = response["formatted"]
+        response, first_token_at = await stream_generate(state, msg)
+    except Exception:
+        # Don't leave a half-streamed answer behind; on_message reports the error
+        await msg.remove()
+        raise
+    state.update(response)
+    citations = format_citations(state["answer"].citations, state["context"])
+    if citations:
+        await msg.stream_token(citations)
+    await msg.send()
+
+    total = time.perf_counter() - start
+    ttft = (first_token_at - start) if first_token_at else total
+    stage_seconds("quote.first_token", ttft)
+    stage_seconds("quote.request", total)
+    debugprint(f"quote: time to first token {ttft:.2f}s, total {total:.2f}s")
 
-        if not quoted_answer.citations:
-            full_response = f"**Answer:** {quoted_answer.answer}"
-        else:
-            # Format the output with citations
-            citations_str = ""
-            for idx, c in enumerate(quoted_answer.citations, start=1):
-                source_doc = response["context"][c.source_id]
 
-                author = source_doc.metadata.get("author", "Unknown")
-                year = extract_year(source_doc.metadata.get('creationdate', ''))
-                page = int(source_doc.metadata.get("page", 0)) + 1
+async def answer_blocking(question):
+    start = time.perf_counter()
+    response = await graph.ainvoke({"question": question})
+    quoted_answer = response["answer"]
 
-                # if not verify_quote_in_source(c.quote, formatted_docs):
-                #     print('skipping')
-                #     continue
+    citations = format_citations(quoted_answer.citations, response["context"])
+    full_response = f"**Answer:** {quoted_answer.answer}{citations}"
 
-                citations_str += (
-                    f'Quote {idx}: "{c.quote}" ({author}, {year}, p. {page})\n\n'
-                )
-            full_response = f"**Answer:** {quoted_answer.answer}\n\n**Citations:**\n{citations_str}"
+    await cl.Message(content=full_response).send()
+    total = time.perf_counter() - start
+    stage_seconds("quote.first_token", total)
+    stage_seconds("quote.request", total)
+    debugprint(f"quote: time to first token {total:.2f}s, total {total:.2f}s")
 
-        await cl.Message(content=full_response).send()
+
+@cl.on_message
+async def on_message(message: cl.Message):
+    try:
+        if STREAMING:
+            await answer_streaming(message.content)
+        else:
+            await answer_blocking(message.content)
     except Exception as e:
         await cl.Message(content=f"An error occurred: {str(e)}").send()
\ No newline at end of file
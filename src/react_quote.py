@@ -1,13 +1,23 @@
+import functools
 from typing import Annotated, TypedDict, List
 from llm import LLM
 from langchain.prompts import PromptTemplate
-from vectorstore import VECTOR_STORE
+from embeddings import EMBEDDINGS
+from retrieval import amulti_search, asearch, normalize_query, split_queries, unit
+from search_filter import parse_filters
+from session_state import SESSION_REUSE_THRESHOLD, SessionStore
+from concurrency import LLM_LIMIT, VECTOR_LIMIT
 from langchain.schema.runnable import Runnable
 from pydantic import BaseModel, Field
 from langchain_core.documents import Document
-from util import extract_year
+from context import pack_context
+from metrics import COUNT_BUCKETS, inc, instrument, mount_metrics_endpoint, observe, timed
+from util import debugprint
+from verify import format_citations
+from readiness import NOT_READY_MESSAGE, acheck_ready
 import chainlit as cl
-from langchain.agents import create_react_agent, AgentExecutor, tool
+from langchain.agents import create_react_agent, tool
+from agent_budget import BudgetedAgentExecutor
 from langchain_core.agents import AgentAction, AgentFinish
 
 # Keep the Citation and QuotedAnswer models the same
@@ -37,41 +47,87 @@ class QuotedAnswer(BaseModel):
         "List of sources (author + page number) used to answer the question",
     ]
 
-# Keep the format_docs_with_id function the same
-def format_docs_with_id(docs: List[Document]) -> str:
-    formatted = [
-        f"Source ID: {i}\n"
-        f"Article Title: {doc.metadata.get('title', 'Untitled')}\n"
-        f"Author: {doc.metadata.get('author', 'Unknown')}\n"
-        f"Page Number: {int(doc.metadata.get('page', 0)) + 1}\n"
-        f"Year: {extract_year(doc.metadata.get('creationdate', ''))}\n"
-        f"Article Snippet: {doc.page_content}"
-        for i, doc in enumerate(docs)
-    ] 
-    for i, doc in enumerate(docs): print(doc.metadata)
-    return "\n\n" + "\n\n".join(formatted)
-
-# Define a global variable to store retrieved documents
-retrieved_documents = []
+# Retrieval state per Chainlit session, so concurrent sessions don't see each other's documents
+SESSIONS = SessionStore()
+
+def current_session():
+    return SESSIONS.get(cl.context.session.id)
 
 # Create a tool for retrieval instead of a function
 @tool(response_format="content")
-def retrieve_documents(query: str):
-    """Retrieve information related to a query from the document store."""
-    global retrieved_documents
-    retrieved_documents = VECTOR_STORE.similarity_search(query, k=5)
-    formatted_docs = format_docs_with_id(retrieved_documents)
-    return f"Retrieved {len(retrieved_documents)} relevant documents:\n{formatted_docs}"
+@instrument("react_quote.retrieve_documents")
+async def retrieve_documents(query: str):
+    """Retrieve information related to a query from the document store. Append source:FILE, author:NAME or year:YYYY / year:YYYY-YYYY to search only matching documents."""
+    session = current_session()
+    query, filters = parse_filters(query)
+    normalized = normalize_query(query)
+    if filters:
+        normalized += " " + filters.key()
+
+    # Reuse this session's documents for a repeated or near-identical follow-up query
+    retrieval = session.find_exact(normalized)
+    result = "exact"
+    if retrieval is None:
+        async with VECTOR_LIMIT:
+            embedding = await EMBEDDINGS.aembed_query(query)
+        vector = unit(embedding)
+        # Near-identical reuse only among unfiltered retrievals; filtered ones are stored without a vector
+        retrieval = None if filters else session.find_similar(vector, SESSION_REUSE_THRESHOLD)
+        result = "semantic"
+        if retrieval is None:
+            result = "miss"
+            docs = await asearch(query, k=5, embedding=embedding, filters=filters)
+            observe("rag_retrieved_chunks", len(docs), COUNT_BUCKETS, app="react_quote")
+            packed = pack_context(docs)
+            observe("rag_context_tokens", packed.tokens, COUNT_BUCKETS, app="react_quote")
+            debugprint(f"react_quote: context {packed.tokens} prompt tokens ({packed.saved_tokens} saved by packing)")
+            # Keep the packed sources so citation source IDs line up with what the agent saw
+            retrieval = session.add(normalized, None if filters else vector, packed)
+    session.current = retrieval
+    inc("rag_cache_lookups_total", cache="session", result=result)
+
+    packed = retrieval.value
+    return f"Retrieved {len(packed.sources)} relevant documents:\n{packed.text}"
+
+@tool(response_format="content")
+@instrument("react_quote.retrieve_documents_multi")
+async def retrieve_documents_multi(queries: str):
+    """Retrieve information for several sub-queries at once (e.g. each side of a comparison) in one step. Input: the sub-queries separated by " | ", optionally followed by source:, author: or year: filters that apply to all of them."""
+    session = current_session()
+    text, filters = parse_filters(queries)
+    sub_queries = split_queries(text)
+    normalized = " | ".join(sorted(normalize_query(q) for q in sub_queries))
+    if filters:
+        normalized += " " + filters.key()
+
+    retrieval = session.find_exact(normalized)
+    result = "exact"
+    if retrieval is None:
+        result = "miss"
+        docs = await amulti_search(sub_queries, k=5, limit=10, filters=filters)
+        observe("rag_retrieved_chunks", len(docs), COUNT_BUCKETS, app="react_quote")
+        packed = pack_context(docs)
+        observe("rag_context_tokens", packed.tokens, COUNT_BUCKETS, app="react_quote")
+        debugprint(f"react_quote: {len(sub_queries)} sub-queries, context {packed.tokens} prompt tokens "
+                   f"({packed.saved_tokens} saved by packing)")
+        retrieval = session.add(normalized, None, packed)
+    session.current = retrieval
+    inc("rag_cache_lookups_total", cache="session", result=result)
+
+    packed = retrieval.value
+    return f"Retrieved {len(packed.sources)} relevant documents for {len(sub_queries)} sub-queries:\n{packed.text}"
 
 # Create a tool for generating the final answer with citations
 @tool(response_format="content")
-def generate_quoted_answer(question: str):
+@instrument("react_quote.generate_quoted_answer")
+async def generate_quoted_answer(question: str):
     """Generate a well-cited answer based on the retrieved documents."""
-    global retrieved_documents
-    if not retrieved_documents:
+    session = current_session()
+    if session.current is None:
         return "No documents have been retrieved yet. Please use the retrieve_documents tool first."
-    
-    formatted_docs = format_docs_with_id(retrieved_documents)
+
+    retrieved_documents = session.current.value.sources
+    formatted_docs = session.current.value.text
     prompt_text = """
     You're an expert in answering questions. Use the following pieces of documents relevant to the question to answer it. Make sure to not make up new information and only use the information provided in the documents. If you cannot find the relevant information from the documents, answer "I cannot find that information in the provided documents."
 
@@ -85,22 +141,13 @@ def generate_quoted_answer(question: str):
     prompt = PromptTemplate.from_template(prompt_text)
     messages = prompt.invoke({"question": question, "context": formatted_docs})
     structured_llm = LLM.with_structured_output(QuotedAnswer)
-    response = structured_llm.invoke(messages)
+    async with LLM_LIMIT:
+        with timed("react_quote.llm"):
+            response = await structured_llm.ainvoke(messages)
     
-    # Format the response with citations
-    if not response.citations:
-        return f"**Answer:** {response.answer}"
-    else:
-        citations_str = ""
-        for idx, c in enumerate(response.citations, start=1):
-            source_doc = retrieved_documents[c.source_id]
-            author = source_doc.metadata.get("author", "Unknown")
-            year = extract_year(source_doc.metadata.get('creationdate', ''))
-            page = int(source_doc.metadata.get("page", 0)) + 1
-            citations_str += (
-                f'Quote {idx}: "{c.quote}" ({author}, {year}, p. {page})\n\n'
-            )
-        return f"**Answer:** {response.answer}\n\n**Citations:**\n{citations_str}"
+    # Format the response with citations, dropping quotes that aren't in the sources
+    citations = format_citations(response.citations, retrieved_documents)
+    return f"**Answer:** {response.answer}{citations}"
 
 # Create the ReAct prompt template
 REACT_PROMPT_TEMPLATE = '''Answer the following question as best you can, making sure to provide well-cited answers with quotes from the documents. You have access to the following tools:
@@ -125,22 +172,41 @@ Question: {input}
 
 REACT_PROMPT = PromptTemplate.from_template(REACT_PROMPT_TEMPLATE)
 
-# Create the ReAct agent
-tools = [retrieve_documents, generate_quoted_answer]
-agent = create_react_agent(LLM, tools, REACT_PROMPT)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
+# Create the ReAct agent on first use, so importing this module doesn't create the LLM
+tools = [retrieve_documents, retrieve_documents_multi, generate_quoted_answer]
+
+@functools.cache
+def get_agent_executor():
+    agent = create_react_agent(LLM, tools, REACT_PROMPT)
+    # Retrievals set the session's current documents, so only answers are memoized, and
+    # a budget stop returns the last generated answer if there is one
+    return BudgetedAgentExecutor(
+        agent=agent, tools=tools, llm=LLM, verbose=True, handle_parsing_errors=True,
+        answer_tool=generate_quoted_answer.name, memo_tools=frozenset([generate_quoted_answer.name]),
+    )
+
+mount_metrics_endpoint()
 
 # Chainlit integration
 @cl.on_chat_start
 async def on_chat_start():
+    ready, problems = await acheck_ready()
+    if not ready:
+        debugprint(f"react_quote: not ready: {problems}")
+        await cl.Message(content=NOT_READY_MESSAGE).send()
+        return
     await cl.Message(content="Hi! Ask a question and I'll answer it with sources based on the provided documents.").send()
 
+@cl.on_chat_end
+async def on_chat_end():
+    SESSIONS.drop(cl.context.session.id)
+
 @cl.on_message
 async def on_message(message: cl.Message):
     config = {"configurable": {"thread_id": cl.context.session.id}}
     user_input = {"input": message.content}
     
-    async for step in agent_executor.astream(user_input, config=config):
+    async for step in get_agent_executor().astream(user_input, config=config):
         if isinstance(step, dict) and "intermediate_steps" in step:
             # This is an intermediate step in the ReAct process
             # You could display the agent's thinking if desired
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+import embeddings
+import llm
+import vectorstore
+from lazy import COLD_STARTS
+from util import debugprint
+
+NOT_READY_MESSAGE = "The service is not ready yet (a backend is unavailable). Please try again in a moment."
+
+
+def check_ready():
+    """
+    Create the embedding model, LLM and vector store if needed and ping the vector
+    store. Returns (ready, problems), one problem string per failing component.
+    """
+    checks = [
+        ("embeddings", lambda: embeddings.EMBEDDINGS.get()),
+        ("LLM", lambda: llm.LLM.get()),
+        ("vector store", vectorstore.ping),
+    ]
+    start = time.perf_counter()
+    problems = []
+    for name, check in checks:
+        try:
+            check()
+        except Exception as e:
+            problems.append(f"{name}: {type(e).__name__}: {e}")
+    cold_starts = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in COLD_STARTS.items())
+    debugprint(f"Readiness check took {time.perf_counter() - start:.2f}s (cold starts: {cold_starts or 'none'})")
+    return not problems, problems
+
+
+async def acheck_ready():
+    # Creating the clients and pinging Milvus block, keep them off the event loop
+    return await asyncio.to_thread(check_ready)
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from concurrency import VECTOR_LIMIT
+from doc_store import attach_metadata
+from embeddings import EMBEDDINGS
+from metrics import METRICS, stage_seconds
+from langchain_core.documents import Document
+from search_filter import SearchFilter
+from util import debugprint, index_version
+from vectorstore import VECTOR_STORE, doc_filter
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", 1024))
+RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", 3600))
+# Cosine similarity above which a cached query's results are reused
+RETRIEVAL_CACHE_THRESHOLD = float(os.environ.get("RETRIEVAL_CACHE_THRESHOLD", 0.97))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+
+class RetrievalCache:
+    """
+    Two-tier LRU/TTL cache of similarity_search results.
+    Exact tier: normalized query string. Semantic tier: a cached query whose embedding
+    is within `threshold` cosine similarity. Everything is dropped when the indexer
+    bumps the index version.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600.0, threshold=0.97):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._clear()
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def _clear(self):
+        # (normalized query, k, filter key) -> (slot, docs, created, (embed seconds, search seconds))
+        self._entries = OrderedDict()
+        self._vectors = None  # one normalized query embedding per slot
+        self._slot_keys = [None] * self.max_entries
+        self._free = list(range(self.max_entries))
+        self._version = index_version()
+
+    def _check_version(self):
+        version = index_version()
+        if version != self._version:
+            self._clear()
+            self._version = version
+
+    def _drop(self, key):
+        slot = self._entries.pop(key)[0]
+        self._slot_keys[slot] = None
+        self._free.append(slot)
+
+    def _hit(self, key, semantic):
+        slot, docs, created, (embed_seconds, search_seconds) = self._entries[key]
+        if time.time() - created > self.ttl:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        if semantic:
+            # The query was still embedded to find this entry
+            self.hits_semantic += 1
+            self.saved_seconds += search_seconds
+        else:
+            self.hits_exact += 1
+            self.saved_seconds += embed_seconds + search_seconds
+        return list(docs)
+
+    def get_exact(self, normalized: str, k: int, scope: str = ""):
+        with self._lock:
+            self._check_version()
+            if (normalized, k, scope) in self._entries:
+                return self._hit((normalized, k, scope), semantic=False)
+        return None
+
+    def get_semantic(self, vector: np.ndarray, k: int, scope: str = ""):
+        with self._lock:
+            if self._vectors is None or not self._entries:
+                return None
+            scores = self._vectors @ vector
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+                key = self._slot_keys[slot]
+                if key is not None and key[1:] == (k, scope):
+                    # An expired entry is dropped; keep looking at the next best match
+                    docs = self._hit(key, semantic=True)
+                    if docs is not None:
+                        return docs
+        return None
+
+    def put(self, normalized: str, k: int, vector: np.ndarray, docs: List[Document], cost, scope: str = ""):
+        with self._lock:
+            key = (normalized, k, scope)
+            if key in self._entries:
+                self._drop(key)
+            while not self._free:
+                self._drop(next(iter(self._entries)))
+            slot = self._free.pop()
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            self._vectors[slot] = vector
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, list(docs), time.time(), cost)
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stats(self):
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+RETRIEVAL_CACHE = RetrievalCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_THRESHOLD)
+METRICS.add_collector(lambda: [
+    ("rag_cache_lookups_total", {"cache": "retrieval", "result": "exact"}, RETRIEVAL_CACHE.hits_exact),
+    ("rag_cache_lookups_total", {"cache": "retrieval", "result": "semantic"}, RETRIEVAL_CACHE.hits_semantic),
+    ("rag_cache_lookups_total", {"cache": "retrieval", "result": "miss"}, RETRIEVAL_CACHE.misses),
+])
+
+
+def unit(vector: List[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1)
+
+
+def _filter_kwargs(filters: Optional[SearchFilter]):
+    """Vector store search kwargs for a filter, or None if no document passes it."""
+    if not filters:
+        return {}
+    doc_ids = filters.doc_ids()
+    return doc_filter(doc_ids) if doc_ids else None
+
+
+def search(query: str, k: int = 5, filters: Optional[SearchFilter] = None) -> List[Document]:
+    """
+    Cached replacement for VECTOR_STORE.similarity_search(query, k=k). filters restricts
+    the search to matching documents inside the vector store.
+    """
+    normalized = normalize_query(query)
+    scope = filters.key() if filters else ""
+    docs = RETRIEVAL_CACHE.get_exact(normalized, k, scope)
+    if docs is not None:
+        debugprint(f"Retrieval cache hit (exact): {query!r}")
+        return docs
+    search_kwargs = _filter_kwargs(filters)
+    if search_kwargs is None:
+        debugprint(f"No documents match the filter {scope}")
+        return []
+
+    start = time.perf_counter()
+    embedding = EMBEDDINGS.embed_query(query)
+    embed_seconds = time.perf_counter() - start
+    stage_seconds("embed_query", embed_seconds)
+    vector = unit(embedding)
+    docs = RETRIEVAL_CACHE.get_semantic(vector, k, scope)
+    if docs is not None:
+        debugprint(f"Retrieval cache hit (semantic): {query!r}")
+        return docs
+
+    RETRIEVAL_CACHE.miss()
+    start = time.perf_counter()
+    docs = VECTOR_STORE.similarity_search_by_vector(embedding, k=k, **search_kwargs)
+    search_seconds = time.perf_counter() - start
+    stage_seconds("vector_search", search_seconds)
+    attach_metadata(docs)
+    RETRIEVAL_CACHE.put(normalized, k, vector, docs, (embed_seconds, search_seconds), scope)
+    return docs
+
+
+async def asearch(query: str, k: int = 5, embedding: Optional[List[float]] = None,
+                  filters: Optional[SearchFilter] = None) -> List[Document]:
+    """
+    Async version of search(); embedding and vector store calls are bounded by VECTOR_LIMIT.
+    Pass the query's embedding if the caller already has it.
+    """
+    normalized = normalize_query(query)
+    scope = filters.key() if filters else ""
+    docs = RETRIEVAL_CACHE.get_exact(normalized, k, scope)
+    if docs is not None:
+        debugprint(f"Retrieval cache hit (exact): {query!r}")
+        return docs
+    search_kwargs = _filter_kwargs(filters)
+    if search_kwargs is None:
+        debugprint(f"No documents match the filter {scope}")
+        return []
+
+    embed_seconds = 0.0
+    if embedding is None:
+        async with VECTOR_LIMIT:
+            start = time.perf_counter()
+            embedding = await EMBEDDINGS.aembed_query(query)
+            embed_seconds = time.perf_counter() - start
+        stage_seconds("embed_query", embed_seconds)
+    vector = unit(embedding)
+    docs = RETRIEVAL_CACHE.get_semantic(vector, k, scope)
+    if docs is not None:
+        debugprint(f"Retrieval cache hit (semantic): {query!r}")
+        return docs
+
+    RETRIEVAL_CACHE.miss()
+    async with VECTOR_LIMIT:
+        start = time.perf_counter()
+        docs = await VECTOR_STORE.asimilarity_search_by_vector(embedding, k=k, **search_kwargs)
+        search_seconds = time.perf_counter() - start
+    stage_seconds("vector_search", search_seconds)
+    # Local SQLite lookup of a handful of doc_ids, usually served from memory
+    attach_metadata(docs)
+    RETRIEVAL_CACHE.put(normalized, k, vector, docs, (embed_seconds, search_seconds), scope)
+    return docs
+
+
+# Reciprocal rank fusion constant; larger values flatten the rank weighting
+RRF_K = 60
+
+
+def split_queries(text: str) -> List[str]:
+    """Sub-queries from an agent's action input: a JSON list, or one per line / separated by "|"."""
+    text = text.strip()
+    if text.startswith("["):
+        try:
+            queries = json.loads(text)
+            if isinstance(queries, list):
+                return [str(q).strip() for q in queries if str(q).strip()]
+        except json.JSONDecodeError:
+            pass
+    return [q.strip() for q in re.split(r"[\n|]", text) if q.strip()]
+
+
+def _doc_key(doc: Document):
+    pk = doc.metadata.get("pk")
+    return pk if pk is not None else (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content)
+
+
+async def amulti_search(queries: List[str], k: int = 5, limit: Optional[int] = None,
+                        filters: Optional[SearchFilter] = None) -> List[Document]:
+    """
+    Fan-out retrieval for several sub-queries: one batched embedding call, concurrent
+    cached searches, then duplicates (by primary key) merged with reciprocal rank fusion.
+    Returns at most `limit` documents, best fused rank first.
+    """
+    unique = {}
+    for query in queries:
+        unique.setdefault(normalize_query(query), query)
+    queries = list(unique.values())
+    if not queries:
+        return []
+
+    async with VECTOR_LIMIT:
+        start = time.perf_counter()
+        embeddings = await EMBEDDINGS.aembed_documents(queries)
+    stage_seconds("embed_query_batch", time.perf_counter() - start)
+    results = await asyncio.gather(*(
+        asearch(query, k=k, embedding=embedding, filters=filters) for query, embedding in zip(queries, embeddings)
+    ))
+
+    scores = {}
+    docs = {}
+    for result in results:
+        for rank, doc in enumerate(result):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+    fused = sorted(scores, key=lambda key: -scores[key])
+    return [docs[key] for key in fused[:limit]]
@@ -0,0 +1,88 @@
+import json
+import os
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from doc_store import DOC_STORE
+from util import extract_year
+
+# Inline filters in a question or tool input, e.g.
+#   what is measured? author:"Jane Doe" year:2019-2021 source:survey.pdf
+# year takes YYYY, YYYY-YYYY, YYYY- or -YYYY; repeated source/author filters are OR-ed
+_FILTER_RE = re.compile(r'(?i)(?<!\S)(source|author|year):("[^"]*"|\S+)')
+_YEAR_RE = re.compile(r"^(\d{4})?(-)?(\d{4})?$")
+
+
+class SearchFilter(NamedTuple):
+    sources: Tuple[str, ...] = ()
+    authors: Tuple[str, ...] = ()
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+
+    def __bool__(self):
+        return bool(self.sources or self.authors or self.year_from is not None or self.year_to is not None)
+
+    def key(self) -> str:
+        """Stable string for cache keys; empty when there is no filter."""
+        if not self:
+            return ""
+        return json.dumps([sorted(self.sources), sorted(self.authors), self.year_from, self.year_to])
+
+    def merged(self, other: "SearchFilter") -> "SearchFilter":
+        """Both filters' sources/authors, and the narrower year range."""
+        year_from = max((y for y in (self.year_from, other.year_from) if y is not None), default=None)
+        year_to = min((y for y in (self.year_to, other.year_to) if y is not None), default=None)
+        return SearchFilter(self.sources + other.sources, self.authors + other.authors, year_from, year_to)
+
+    def matches(self, metadata: dict) -> bool:
+        """Whether a document (its document-table metadata) passes the filter."""
+        if self.sources:
+            path = (metadata.get("source") or "").lower()
+            name = os.path.basename(path)
+            if not any(s in (path, name, os.path.splitext(name)[0]) for s in self.sources):
+                return False
+        if self.authors:
+            author = (metadata.get("author") or "").lower()
+            if not any(a in author for a in self.authors):
+                return False
+        if self.year_from is not None or self.year_to is not None:
+            year = extract_year(metadata.get("creationdate") or "")
+            if not year.isdigit():
+                return False
+            if self.year_from is not None and int(year) < self.year_from:
+                return False
+            if self.year_to is not None and int(year) > self.year_to:
+                return False
+        return True
+
+    def doc_ids(self) -> List[str]:
+        """The documents the filter admits; the vector store search is restricted to these."""
+        return sorted(doc_id for doc_id, metadata in DOC_STORE.all().items() if self.matches(metadata))
+
+
+def parse_filters(text: str) -> Tuple[str, SearchFilter]:
+    """Splits inline filters off a question: returns (question without them, filter)."""
+    sources, authors = [], []
+    year_from = year_to = None
+
+    def take(match):
+        nonlocal year_from, year_to
+        field, value = match.group(1).lower(), match.group(2).strip('"').strip().lower()
+        if not value:
+            return match.group(0)
+        if field == "source":
+            sources.append(value)
+        elif field == "author":
+            authors.append(value)
+        else:
+            years = _YEAR_RE.match(value)
+            if not years or not (years.group(1) or years.group(3)):
+                return match.group(0)  # not a year, leave it in the question
+            year_from = int(years.group(1)) if years.group(1) else None
+            year_to = int(years.group(3)) if years.group(3) else None
+            if not years.group(2):
+                year_to = year_from
+        return ""
+
+    question = " ".join(_FILTER_RE.sub(take, text).split())
+    return question, SearchFilter(tuple(sources), tuple(authors), year_from, year_to)
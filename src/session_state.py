@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+
+SESSION_MAX = int(os.environ.get("SESSION_MAX", 1000))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", 1800))
+SESSION_MAX_RETRIEVALS = int(os.environ.get("SESSION_MAX_RETRIEVALS", 8))
+# Cosine similarity above which a follow-up query reuses an earlier retrieval
+SESSION_REUSE_THRESHOLD = float(os.environ.get("SESSION_REUSE_THRESHOLD", 0.95))
+
+
+class Retrieval(NamedTuple):
+    query: str  # normalized
+    vector: Optional[np.ndarray]  # unit-length query embedding
+    value: Any
+
+
+class Session:
+    def __init__(self, max_retrievals: int):
+        self.retrievals = deque(maxlen=max_retrievals)
+        self.current: Optional[Retrieval] = None
+        self.last_used = time.monotonic()
+
+    def find_exact(self, query: str) -> Optional[Retrieval]:
+        for retrieval in reversed(self.retrievals):
+            if retrieval.query == query:
+                return retrieval
+        return None
+
+    def find_similar(self, vector: np.ndarray, threshold: float) -> Optional[Retrieval]:
+        best, best_score = None, threshold
+        for retrieval in self.retrievals:
+            if retrieval.vector is None:
+                continue
+            score = float(retrieval.vector @ vector)
+            if score >= best_score:
+                best, best_score = retrieval, score
+        return best
+
+    def add(self, query: str, vector: Optional[np.ndarray], value: Any) -> Retrieval:
+        retrieval = Retrieval(query, vector, value)
+        self.retrievals.append(retrieval)
+        return retrieval
+
+
+class SessionStore:
+    """
+    Per-session retrieval state, keyed by the Chainlit session id. Holds at most
+    max_sessions sessions (least recently used evicted first), drops sessions idle for
+    longer than idle_ttl seconds, and keeps the last max_retrievals retrievals per session.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, idle_ttl=SESSION_IDLE_TTL,
+                 max_retrievals=SESSION_MAX_RETRIEVALS):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_retrievals = max_retrievals
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - session.last_used > self.idle_ttl:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def get(self, session_id: str) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(self.max_retrievals)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = now
+            self._evict(now)
+        return session
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -1,7 +1,18 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
 from typing import TypedDict
-from llm import LLM
+from llm import LLM, LLM_MODEL
 from langchain.prompts import PromptTemplate
-from vectorstore import VECTOR_STORE
+from retrieval import asearch
+from search_filter import SearchFilter, parse_filters
+from concurrency import LLM_LIMIT, RateLimiter
+from embeddings import EMBEDDINGS
+from answer_cache import ANSWER_CACHE, ANSWER_CACHE_ENABLED, prompt_version
+from metrics import COUNT_BUCKETS, instrument, observe, timed
 from langgraph.graph import StateGraph, START
 from langchain.schema.runnable import Runnable
 
@@ -15,21 +26,42 @@ Answer:
 """.strip()
 
 PROMPT = PromptTemplate.from_template(PROMPT)
+PROMPT_VERSION = prompt_version(PROMPT.template)
 
 class State(TypedDict):
     question: str
+    filters: SearchFilter
     context: list
     answer: str
     
 
-def retrieve(state):
-    results = VECTOR_STORE.similarity_search(state["question"], k=5)
-    return {"context": results}
+@instrument("single.retrieve")
+async def retrieve(state):
+    # Inline filters (source:, author:, year:) scope the search and are dropped from the question
+    question, filters = parse_filters(state["question"])
+    if state.get("filters"):
+        filters = state["filters"].merged(filters)
+    results = await asearch(question, k=5, filters=filters)
+    observe("rag_retrieved_chunks", len(results), COUNT_BUCKETS, app="single")
+    return {"question": question, "context": results}
+
+@instrument("single.generate")
+async def generate(state):
+    key = None
+    if ANSWER_CACHE_ENABLED:
+        chunk_ids = [doc.metadata.get("pk") for doc in state["context"]]
+        key = ANSWER_CACHE.key(LLM_MODEL, PROMPT_VERSION, state["question"], chunk_ids)
+        cached = ANSWER_CACHE.lookup(key) if key else None
+        if cached is not None:
+            return {"answer": cached}
 
-def generate(state):
     doc_text = "\n\n".join(doc.page_content for doc in state["context"])
     msgs = PROMPT.invoke({"question": state["question"], "context": doc_text})
-    response = LLM.invoke(msgs)
+    async with LLM_LIMIT:
+        with timed("single.llm"):
+            response = await LLM.ainvoke(msgs)
+    if key:
+        ANSWER_CACHE.store(key, response.content, chunk_ids)
     return {"answer": response.content}
 
 
@@ -39,6 +71,153 @@ graph_builder = StateGraph(State).add_sequence([retrieve, generate])
 graph_builder.add_edge(START, "retrieve")
 graph = graph_builder.compile()
 
-q = input("Enter a question: ")
-response = graph.invoke({"question": q})
-print(response["answer"])
\ No newline at end of file
+# Batch mode
+
+def read_questions(path, question_field="question", id_field="id"):
+    """Yields (id, question) from a JSONL or CSV file; ids default to the row number."""
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for i, row in enumerate(rows):
+            question = (row.get(question_field) or "").strip()
+            item_id = row.get(id_field)
+            if question:
+                yield str(i if item_id is None else item_id), question
+
+
+def compact_output(path):
+    """
+    Rewrite an earlier run's output with one record per answered id, dropping failed
+    items (they are retried) and a torn last line. Returns the answered ids.
+    """
+    records = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn write at the end of an interrupted run
+            if "error" not in record:
+                records[record["id"]] = record
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for record in records.values():
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
+    return set(records)
+
+
+async def answer_item(item_id, question, embedding, embed_seconds, filters=None):
+    start = time.perf_counter()
+    record = {"id": item_id, "question": question}
+    try:
+        text, inline = parse_filters(question)
+        filters = filters.merged(inline) if filters else inline
+        docs = await asearch(text, k=5, embedding=embedding, filters=filters)
+        retrieved = time.perf_counter()
+        response = await generate({"question": text, "context": docs})
+        record["answer"] = response["answer"]
+        record["retrieved"] = [
+            {"source": doc.metadata.get("source"), "page": doc.metadata.get("page"), "pk": doc.metadata.get("pk")}
+            for doc in docs
+        ]
+        record["timings"] = {
+            "embed_s": round(embed_seconds, 4),
+            "retrieve_s": round(retrieved - start, 4),
+            "generate_s": round(time.perf_counter() - retrieved, 4),
+        }
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record.setdefault("timings", {})["total_s"] = round(time.perf_counter() - start + embed_seconds, 4)
+    return record
+
+
+async def run_batch(input_path, output_path, concurrency=8, embed_batch_size=128, rate=None,
+                    question_field="question", id_field="id", filters=None):
+    """
+    Answer every question in input_path, appending one JSON line per question to
+    output_path as answers arrive. Questions are embedded embed_batch_size at a time,
+    at most `concurrency` are answered at once (and at most `rate` started per second),
+    and ids already answered in output_path are skipped, so an interrupted run can be
+    resumed; output_path keeps one record per id.
+    """
+    done = compact_output(output_path)
+    limiter = RateLimiter(rate) if rate else None
+    # Bounded, so questions are read and embedded only a little ahead of the workers
+    pending = asyncio.Queue(maxsize=embed_batch_size)
+    counts = {"answered": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    async def embed_window(window):
+        t = time.perf_counter()
+        try:
+            vectors = await EMBEDDINGS.aembed_documents([parse_filters(question)[0] for _, question in window])
+        except Exception as e:
+            print(f"Batch embedding failed ({type(e).__name__}: {e}), embedding one by one")
+            vectors = [None] * len(window)
+        seconds = (time.perf_counter() - t) / len(window)
+        for (item_id, question), vector in zip(window, vectors):
+            await pending.put((item_id, question, vector, seconds))
+
+    async def produce():
+        window = []
+        for item_id, question in read_questions(input_path, question_field, id_field):
+            if item_id in done:
+                counts["skipped"] += 1
+                continue
+            window.append((item_id, question))
+            if len(window) >= embed_batch_size:
+                await embed_window(window)
+                window = []
+        if window:
+            await embed_window(window)
+        for _ in range(concurrency):
+            await pending.put(None)
+
+    async def work(out):
+        while (item := await pending.get()) is not None:
+            if limiter is not None:
+                await limiter.wait()
+            record = await answer_item(*item, filters=filters)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            counts["failed" if "error" in record else "answered"] += 1
+            finished = counts["answered"] + counts["failed"]
+            if finished % 100 == 0:
+                print(f"{finished} answered ({counts['failed']} failed), "
+                      f"{finished / (time.perf_counter() - start):.1f}/s")
+
+    with open(output_path, "a") as out:
+        await asyncio.gather(produce(), *(work(out) for _ in range(concurrency)))
+
+    elapsed = time.perf_counter() - start
+    print(f"Answered {counts['answered']} questions ({counts['failed']} failed, "
+          f"{counts['skipped']} already done) in {elapsed:.1f}s")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer one question interactively, or a file of them")
+    parser.add_argument("--batch", metavar="INPUT", help="JSONL or CSV file of questions")
+    parser.add_argument("--output", default="answers.jsonl", help="JSONL output, also the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions answered at once")
+    parser.add_argument("--embed-batch-size", type=int, default=128, help="questions per embedding request")
+    parser.add_argument("--rate", type=float, help="max questions started per second")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--filter", default="",
+                        help='restrict retrieval, e.g. \'author:"Jane Doe" year:2019-2021 source:survey.pdf\'')
+    args = parser.parse_args()
+    filters = parse_filters(args.filter)[1]
+
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.output, args.concurrency, args.embed_batch_size,
+                              args.rate, args.question_field, args.id_field, filters))
+    else:
+        q = input("Enter a question: ")
+        response = asyncio.run(graph.ainvoke({"question": q, "filters": filters}))
+        print(response["answer"])
@@ -0,0 +1,143 @@
+"""
+Index tuning harness: copies the vectors of the main collection into a scratch
+collection, builds each candidate index on it and reports recall@k against FLAT
+ground truth together with p50/p99 search latency.
+
+    python3 src/tune_index.py --queries questions.txt
+"""
+from embeddings import EMBEDDINGS
+from vectorstore import COLLECTION_NAME, VECTOR_BACKEND, VECTOR_STORE, index_params, search_params
+
+import argparse
+import json
+import statistics
+import time
+
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+
+SCRATCH_COLLECTION = COLLECTION_NAME + "_tuning"
+
+# (index type, build params, [search params, ...]); each index is built once
+DEFAULT_GRID = [
+    ("FLAT", {}, [{}]),
+    ("HNSW", {"M": 16, "efConstruction": 200}, [{"ef": 16}, {"ef": 32}, {"ef": 64}, {"ef": 128}]),
+    ("HNSW", {"M": 32, "efConstruction": 200}, [{"ef": 32}, {"ef": 64}, {"ef": 128}]),
+    ("IVF_FLAT", {"nlist": 1024}, [{"nprobe": 8}, {"nprobe": 16}, {"nprobe": 64}]),
+    ("IVF_PQ", {"nlist": 1024, "m": 64, "nbits": 8}, [{"nprobe": 16}, {"nprobe": 64}]),
+    ("IVF_SQ8", {"nlist": 1024}, [{"nprobe": 16}, {"nprobe": 64}]),
+]
+
+
+def copy_vectors():
+    source = Collection(COLLECTION_NAME)
+    source.load()
+    dim = next(f.params["dim"] for f in source.schema.fields if f.name == "vector")
+
+    if utility.has_collection(SCRATCH_COLLECTION):
+        utility.drop_collection(SCRATCH_COLLECTION)
+    schema = CollectionSchema([
+        FieldSchema("pk", DataType.INT64, is_primary=True),
+        FieldSchema("vector", DataType.FLOAT_VECTOR, dim=dim),
+    ])
+    scratch = Collection(SCRATCH_COLLECTION, schema)
+
+    iterator = source.query_iterator(batch_size=1000, output_fields=["pk", "vector"])
+    count = 0
+    while True:
+        rows = iterator.next()
+        if not rows:
+            iterator.close()
+            break
+        scratch.insert([[row["pk"] for row in rows], [row["vector"] for row in rows]])
+        count += len(rows)
+    scratch.flush()
+    return scratch, count
+
+
+def run_config(collection, query_vectors, index_type, search, k):
+    params = search_params(index_type, search)
+    results, latencies = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        hits = collection.search(data=[vector], anns_field="vector", param=params, limit=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([hit.id for hit in hits[0]])
+    return results, latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def tune(queries, grid, k):
+    collection, count = copy_vectors()
+    print(f"Copied {count} vectors into {SCRATCH_COLLECTION}")
+    query_vectors = EMBEDDINGS.embed_documents(queries)
+
+    truth = None
+    report = []
+    try:
+        for index_type, build, searches in grid:
+            build = dict(build)
+            if "nlist" in build:
+                build["nlist"] = max(1, min(build["nlist"], count))
+            collection.release()
+            if collection.has_index():
+                collection.drop_index()
+            start = time.perf_counter()
+            collection.create_index("vector", index_params(index_type, build))
+            collection.load()
+            build_seconds = time.perf_counter() - start
+
+            for search in searches:
+                results, latencies = run_config(collection, query_vectors, index_type, search, k)
+                if truth is None:
+                    if index_type != "FLAT":
+                        raise ValueError("The first grid entry must be FLAT (ground truth)")
+                    truth = results
+                recall = statistics.mean(
+                    len(set(got) & set(expected)) / max(1, len(expected))
+                    for got, expected in zip(results, truth)
+                )
+                row = {
+                    "index_type": index_type,
+                    "build_params": build,
+                    "search_params": search,
+                    f"recall@{k}": round(recall, 4),
+                    "p50_ms": round(percentile(latencies, 50), 3),
+                    "p99_ms": round(percentile(latencies, 99), 3),
+                    "build_s": round(build_seconds, 2),
+                }
+                report.append(row)
+                print(f"{index_type:9} {json.dumps(build):40} {json.dumps(search):16} "
+                      f"recall@{k}={row[f'recall@{k}']:.3f}  p50={row['p50_ms']:.2f}ms  "
+                      f"p99={row['p99_ms']:.2f}ms  build={row['build_s']:.1f}s")
+    finally:
+        utility.drop_collection(SCRATCH_COLLECTION)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure recall/latency of Milvus index configurations")
+    parser.add_argument("--queries", required=True, help="text file with one sample question per line")
+    parser.add_argument("--grid", help="JSON file with [[index_type, build_params, [search_params, ...]], ...]")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if VECTOR_BACKEND != "milvus":
+        parser.error("index tuning needs VECTOR_BACKEND=milvus")
+    VECTOR_STORE.get()  # connects to Milvus
+
+    with open(args.queries) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+
+    report = tune(queries, grid, args.k)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
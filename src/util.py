@@ -1,38 +1,37 @@
+import os
 import sys
 import re
 from datetime import datetime
 
+# Local state shared by the indexer and the apps (manifests, caches, ...)
+STATE_DIR = os.environ.get("RAG_STATE_DIR", ".rag_state")
+# Touched by the indexer whenever the collection changes, so caches can invalidate
+INDEX_VERSION_PATH = os.path.join(STATE_DIR, "index_version")
+
+def bump_index_version():
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(INDEX_VERSION_PATH, "w") as f:
+        f.write(str(datetime.now().timestamp()))
+
+def index_version():
+    try:
+        return os.stat(INDEX_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
 def debugprint(*args, **kwargs):
     print(*args, file=sys.stderr, flush=True, **kwargs)
 
-def pad_fields(docs):
-    fields = set()
-    for doc in docs:
-        keys = doc.metadata.keys()
-        types = [type(doc.metadata[key]) for key in keys]
-        ktypes = list(zip(keys, types))
-        fields.update(ktypes)
-    for doc in docs:
-        for field, ftype in fields:
-            if field not in doc.metadata:
-                doc.metadata[field] = ftype()
-
-_GOOD_FIELD_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
-def rename_fields(docs):
-    fields = set()
-    for doc in docs:
-        keys = doc.metadata.keys()
-        fields.update(keys)
-    new_fields = {}
-    for field in fields:
-        new_name = field.replace(" ", "_")
-        new_name = "".join(c if c in _GOOD_FIELD_CHARS else '_' for c in new_name)
-        new_fields[field] = new_name
-    for doc in docs:
-        for field, new_name in new_fields.items():
-            doc.metadata[new_name] = doc.metadata.pop(field)
-
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken missing or its encoding can't be downloaded
+    _ENCODING = None
 
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1  # rough estimate for English text
 
 def extract_year(creationdate: str) -> str:
     # Case 1: ISO 8601 style
@@ -1,31 +1,169 @@
+import json
+import os
+
 from embeddings import EMBEDDINGS
-from langchain_milvus import Milvus
+from lazy import LazySingleton
+from util import STATE_DIR
 
-from pymilvus import Collection, MilvusException, connections, db, utility
+# "milvus" (default) or "numpy" for the embedded memory-mapped store
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "milvus")
 
 MILVUS_URI = "http://milvus:19530"
 DATABASE_NAME = "assignment_rag"
 COLLECTION_NAME = "assignment_rag"
+NUMPY_STORE_PATH = os.path.join(STATE_DIR, "numpy_store")
+# NumPy store search layout: scan the first NUMPY_SEARCH_DIM components (0 = all) stored as
+# NUMPY_QUANTIZATION (float32, float16 or int8), then re-rank k * NUMPY_RERANK_FACTOR
+# candidates at full precision. Takes effect when the store is created (index.py --rebuild).
+NUMPY_SEARCH_DIM = int(os.environ.get("NUMPY_SEARCH_DIM", 0))
+NUMPY_QUANTIZATION = os.environ.get("NUMPY_QUANTIZATION", "float32")
+NUMPY_RERANK_FACTOR = int(os.environ.get("NUMPY_RERANK_FACTOR", 4))
+# Deleted rows are reclaimed after an update once they are this fraction of the store
+NUMPY_COMPACT_RATIO = float(os.environ.get("NUMPY_COMPACT_RATIO", 0.1))
+
+# Milvus index type and its build/search parameters. Changing the index type
+# only takes effect when the collection is created, i.e. after index.py --rebuild.
+# MILVUS_INDEX_PARAMS / MILVUS_SEARCH_PARAMS are JSON objects overriding the defaults,
+# e.g. MILVUS_INDEX_TYPE=HNSW MILVUS_SEARCH_PARAMS='{"ef": 128}'
+MILVUS_INDEX_TYPE = os.environ.get("MILVUS_INDEX_TYPE", "FLAT")
+INDEX_BUILD_PARAMS = {
+    "FLAT": {},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 64, "nbits": 8},
+    "IVF_SQ8": {"nlist": 1024},
+}
+INDEX_SEARCH_PARAMS = {
+    "FLAT": {},
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+}
+
+def index_params(index_type, params=None):
+    if index_type not in INDEX_BUILD_PARAMS:
+        raise ValueError(f"Unsupported index type {index_type!r}, expected one of {list(INDEX_BUILD_PARAMS)}")
+    return {
+        "index_type": index_type,
+        "metric_type": "COSINE",
+        "params": {**INDEX_BUILD_PARAMS[index_type], **(params or {})},
+    }
+
+def search_params(index_type, params=None):
+    return {
+        "metric_type": "COSINE",
+        "params": {**INDEX_SEARCH_PARAMS[index_type], **(params or {})},
+    }
+
+
+# Error types (by name, pymilvus/grpc versions differ) that mean the connection is gone
+_CONNECTION_ERRORS = {"ConnectError", "ConnectionNotExistException", "MilvusUnavailableException", "_InactiveRpcError"}
+
+def _is_connection_error(e):
+    return isinstance(e, ConnectionError) or type(e).__name__ in _CONNECTION_ERRORS or "UNAVAILABLE" in str(e)
+
+
+# VECTOR_STORE is created (and Milvus connected) on first use, not at import
+if VECTOR_BACKEND == "numpy":
+    from numpy_store import NumpyVectorStore
+
+    VECTOR_STORE = LazySingleton(
+        "vector store (numpy)",
+        lambda: NumpyVectorStore(EMBEDDINGS.get(), NUMPY_STORE_PATH, search_dim=NUMPY_SEARCH_DIM,
+                                 quantization=NUMPY_QUANTIZATION, rerank_factor=NUMPY_RERANK_FACTOR),
+    )
+
+    def drop_collection():
+        VECTOR_STORE.drop()
+
+    def ping():
+        VECTOR_STORE.get()
+
+    def doc_filter(doc_ids):
+        # Search kwargs restricting results to these documents
+        return {"doc_ids": doc_ids}
+
+    def ensure_scalar_index():
+        pass  # the store keeps an SQLite index on doc_id
+
+    def compact_store():
+        """Reclaim the rows of deleted chunks; returns how many were reclaimed."""
+        return VECTOR_STORE.compact(NUMPY_COMPACT_RATIO)
+
+elif VECTOR_BACKEND == "milvus":
+    from langchain_milvus import Milvus
+    from pymilvus import Collection, MilvusException, connections, db, utility
+
+    def _connect():
+        # Also used to reconnect, so drop whatever is left of the old connection
+        if connections.has_connection("default"):
+            connections.disconnect("default")
+        connections.connect(
+            host=MILVUS_URI.split("//")[1].split(":")[0],
+            port=int(MILVUS_URI.split("//")[1].split(":")[1])
+        )
+        _existing_databases = db.list_database()
+        if DATABASE_NAME not in _existing_databases:
+            db.create_database(DATABASE_NAME)
+        db.using_database(DATABASE_NAME)
+
+    def _create_store():
+        _connect()
+        return Milvus(
+            embedding_function=EMBEDDINGS.get(),
+            connection_args={"uri": MILVUS_URI, "db_name": "assignment_rag"},
+            index_params=index_params(MILVUS_INDEX_TYPE, json.loads(os.environ.get("MILVUS_INDEX_PARAMS", "{}"))),
+            search_params=search_params(MILVUS_INDEX_TYPE, json.loads(os.environ.get("MILVUS_SEARCH_PARAMS", "{}"))),
+            collection_name=COLLECTION_NAME,
+            auto_id=True,
+        )
+
+    # Searches are retried on a fresh connection; writes (add_embeddings, delete) are not, a
+    # partly applied insert would be duplicated. The indexer resumes them from its journal.
+    VECTOR_STORE = LazySingleton(
+        "vector store (milvus)", _create_store, should_reconnect=_is_connection_error,
+        retry_methods={"similarity_search", "similarity_search_by_vector", "asimilarity_search",
+                       "asimilarity_search_by_vector", "similarity_search_with_score",
+                       "asimilarity_search_with_score"},
+    )
+
+    def doc_filter(doc_ids):
+        # Boolean expression evaluated inside the search; doc_id has a scalar index
+        return {"expr": f"doc_id in {json.dumps(list(doc_ids))}"}
+
+    def ensure_scalar_index():
+        """Index doc_id for filtered search; the collection only exists after the first insert."""
+        VECTOR_STORE.get()  # connects
+        if not utility.has_collection(COLLECTION_NAME):
+            return
+        col = Collection(COLLECTION_NAME)
+        if any(index.field_name == "doc_id" for index in col.indexes):
+            return
+        col.release()
+        col.create_index("doc_id", {"index_type": "INVERTED"}, index_name="doc_id_index")
+        col.load()
+
+    def compact_store():
+        return 0  # Milvus compacts segments with deleted entities in the background
+
+    def drop_collection():
+        VECTOR_STORE.get()  # connects
+        collections = utility.list_collections()
+        if COLLECTION_NAME in collections:
+            col = Collection(name=COLLECTION_NAME)
+            col.drop()
+
+    def ping():
+        store = VECTOR_STORE.get()
+        try:
+            utility.get_server_version()
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            VECTOR_STORE.reset(store)
+            VECTOR_STORE.get()
+            utility.get_server_version()
 
-connections.connect(
-    host=MILVUS_URI.split("//")[1].split(":")[0],
-    port=int(MILVUS_URI.split("//")[1].split(":")[1])
-)
-_existing_databases = db.list_database()
-if DATABASE_NAME not in _existing_databases:
-    db.create_database(DATABASE_NAME)
-db.using_database(DATABASE_NAME)
-
-def drop_collection():
-    collections = utility.list_collections()
-    if COLLECTION_NAME in collections:
-        col = Collection(name=COLLECTION_NAME)
-        col.drop()
-
-VECTOR_STORE = Milvus(
-    embedding_function=EMBEDDINGS,
-    connection_args={"uri": MILVUS_URI, "db_name": "assignment_rag"},
-    index_params={"index_type": "FLAT", "metric_type": "COSINE"},
-    collection_name=COLLECTION_NAME,
-    auto_id=True,
-) 
\ No newline at end of file
+else:
+    raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}, expected 'milvus' or 'numpy'")
@@ -0,0 +1,177 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from typing import List, NamedTuple, Optional, Tuple
+
+from langchain_core.documents import Document
+from util import debugprint, extract_year
+
+_TOKEN_RE = re.compile(r"\w+|\.\.\.|…|[^\w\s]")
+# Quotes are split into segments at these; each segment must appear in order
+_BREAKS = {".", ",", ";", ":", "!", "?", "...", "…"}
+
+
+def _word(token: str) -> str:
+    return unicodedata.normalize("NFKC", token).lower()
+
+
+def _is_word(token: str) -> bool:
+    return token[0].isalnum() or token[0] == "_"
+
+
+class QuoteMatch(NamedTuple):
+    verified: bool
+    source_id: Optional[int]  # the source the quote was found in (may differ from the cited one)
+    span: Optional[Tuple[int, int]]  # character offsets into that source's page_content
+
+
+class IndexedSource:
+    """
+    A chunk normalized once into lowercase word tokens (punctuation dropped) with the
+    character span of each word, plus a bigram -> positions index over the words.
+    """
+
+    def __init__(self, text: str):
+        self.words = []
+        self.spans = []
+        for m in _TOKEN_RE.finditer(text):
+            if _is_word(m.group()):
+                self.words.append(_word(m.group()))
+                self.spans.append(m.span())
+        self.bigrams = defaultdict(list)
+        for i in range(len(self.words) - 1):
+            self.bigrams[(self.words[i], self.words[i + 1])].append(i)
+        self.unigrams = None
+
+    def find(self, segment: List[str], start: int) -> int:
+        """Position of the first occurrence of segment at or after word `start`, or -1."""
+        if len(segment) == 1:
+            if self.unigrams is None:
+                self.unigrams = defaultdict(list)
+                for i, word in enumerate(self.words):
+                    self.unigrams[word].append(i)
+            positions = self.unigrams.get(segment[0], [])
+        else:
+            positions = self.bigrams.get((segment[0], segment[1]), [])
+        n = len(segment)
+        for pos in positions[bisect_left(positions, start):]:
+            if self.words[pos:pos + n] == segment:
+                return pos
+        return -1
+
+    def match(self, segments: List[List[str]]) -> Optional[Tuple[int, int]]:
+        """Find all segments in order; returns the character span covering them."""
+        cursor = 0
+        first = last = None
+        for segment in segments:
+            pos = self.find(segment, cursor)
+            if pos == -1:
+                return None
+            if first is None:
+                first = pos
+            cursor = pos + len(segment)
+            last = cursor - 1
+        if first is None:
+            return None
+        return self.spans[first][0], self.spans[last][1]
+
+
+def quote_segments(quote: str) -> List[List[str]]:
+    """
+    Split a quote at ellipses and sentence punctuation into word segments. As in
+    util.verify_quote_in_source, one-word segments are too fuzzy to check and are
+    skipped, unless the quote has nothing longer.
+    """
+    segments, current = [], []
+    for m in _TOKEN_RE.finditer(quote):
+        token = m.group()
+        if token in _BREAKS:
+            if current:
+                segments.append(current)
+            current = []
+        elif _is_word(token):
+            current.append(_word(token))
+    if current:
+        segments.append(current)
+    long_segments = [segment for segment in segments if len(segment) >= 2]
+    return long_segments or segments
+
+
+class QuoteVerifier:
+    """
+    Verifies LLM quotes against retrieved chunks. Each chunk is tokenized and indexed
+    once (prepare() at retrieval time, or lazily) and kept in a bounded LRU keyed by a
+    hash of its text, so verifying a citation is a few dictionary lookups.
+    """
+
+    def __init__(self, max_sources: int = 4096):
+        self.max_sources = max_sources
+        self._sources = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _indexed(self, text: str) -> IndexedSource:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            source = self._sources.get(key)
+            if source is not None:
+                self._sources.move_to_end(key)
+                return source
+        source = IndexedSource(text)
+        with self._lock:
+            self._sources[key] = source
+            while len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        return source
+
+    def prepare(self, docs: List[Document]) -> None:
+        for doc in docs:
+            self._indexed(doc.page_content)
+
+    def verify(self, quote: str, docs: List[Document], source_id: Optional[int] = None) -> QuoteMatch:
+        segments = quote_segments(quote)
+        if not segments:
+            return QuoteMatch(False, None, None)
+        # Try the cited source first, then the rest
+        order = list(range(len(docs)))
+        if source_id is not None and 0 <= source_id < len(docs):
+            order.remove(source_id)
+            order.insert(0, source_id)
+        for i in order:
+            span = self._indexed(docs[i].page_content).match(segments)
+            if span is not None:
+                return QuoteMatch(True, i, span)
+        return QuoteMatch(False, None, None)
+
+    def verify_citations(self, citations, docs: List[Document]) -> List[QuoteMatch]:
+        """Verify every citation (objects with .quote and .source_id) of one answer."""
+        self.prepare(docs)
+        return [self.verify(c.quote, docs, c.source_id) for c in citations]
+
+
+VERIFIER = QuoteVerifier()
+
+
+def format_citations(citations, docs: List[Document], verifier: QuoteVerifier = VERIFIER) -> str:
+    """
+    The "Citations" section of an answer: each verified quote, attributed to the source it
+    was actually found in. Unverified quotes are dropped; empty when none is left.
+    """
+    lines = ""
+    idx = 0
+    for c, match in zip(citations, verifier.verify_citations(citations, docs)):
+        if not match.verified:
+            debugprint(f"Skipping unverified quote: {c.quote!r}")
+            continue
+        # The quote may have been found in a different source than the one cited
+        source_doc = docs[match.source_id]
+        author = source_doc.metadata.get("author", "Unknown")
+        year = extract_year(source_doc.metadata.get('creationdate', ''))
+        page = int(source_doc.metadata.get("page", 0)) + 1
+        idx += 1
+        lines += f'Quote {idx}: "{c.quote}" ({author}, {year}, p. {page})\n\n'
+    if not lines:
+        return ""
+    return f"\n\n**Citations:**\n{lines}"
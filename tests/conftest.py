@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The app modules live flat in src/ and import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+# Module-level caches and stores resolve their files under the state dir at import time
+os.environ.setdefault("RAG_STATE_DIR", tempfile.mkdtemp(prefix="rag_state_"))
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from typing import Any
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.agents import BaseSingleActionAgent
+from langchain_core.agents import AgentAction
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.tools import tool
+
+from agent_budget import TOOL_TIMEOUT_OBSERVATION, BudgetedAgentExecutor
+
+CALLS = []
+
+
+@tool
+def search(query: str) -> str:
+    """Search the documents."""
+    CALLS.append(("search", query))
+    return f"results for {query}"
+
+
+@tool
+def retrieve(query: str) -> str:
+    """Replace the current documents."""
+    CALLS.append(("retrieve", query))
+    return f"retrieved {query}"
+
+
+@tool
+def answer(question: str) -> str:
+    """Answer from the current documents."""
+    CALLS.append(("answer", question))
+    return f"answer to {question}"
+
+
+@tool
+def long_search(query: str) -> str:
+    """Search, returning a lot of text."""
+    CALLS.append(("long_search", query))
+    return "lorem ipsum dolor sit amet " * 200
+
+
+@tool
+async def slow_search(query: str) -> str:
+    """Search slowly."""
+    CALLS.append(("slow_search", query))
+    await asyncio.sleep(2)
+    return "too late"
+
+
+class ScriptedAgent(BaseSingleActionAgent):
+    """Plays back fixed (tool, input) actions, then repeats the last one forever."""
+
+    script: Any
+
+    @property
+    def input_keys(self):
+        return ["input"]
+
+    def plan(self, intermediate_steps, callbacks=None, **kwargs):
+        tool_name, tool_input = self.script[min(len(intermediate_steps), len(self.script) - 1)]
+        return AgentAction(tool_name, tool_input, f"calling {tool_name}")
+
+    async def aplan(self, intermediate_steps, callbacks=None, **kwargs):
+        return self.plan(intermediate_steps, callbacks, **kwargs)
+
+
+class NoLLM(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        raise AssertionError("the finalize LLM call was not expected")
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    CALLS.clear()
+
+
+def executor(script, tools=(search, retrieve, answer), llm=None, **kwargs):
+    return BudgetedAgentExecutor(
+        agent=ScriptedAgent(script=script), tools=list(tools),
+        llm=llm or FakeListChatModel(responses=["finalized answer"]), **kwargs,
+    )
+
+
+def run(agent, question="what is rag?"):
+    return agent.invoke({"input": question})
+
+
+def test_repeated_call_is_answered_from_the_memo():
+    agent = executor([("search", "what is RAG?"), ("search", "what is rag"), ("search", "chunking")], max_steps=3)
+
+    result = run(agent)
+
+    assert CALLS == [("search", "what is RAG?"), ("search", "chunking")]
+    assert result["output"] == "finalized answer"
+
+
+def test_non_memo_tool_clears_the_memo():
+    script = [("search", "rag"), ("retrieve", "other papers"), ("search", "rag")]
+    agent = executor(script, memo_tools=frozenset(["search"]), max_steps=3)
+
+    run(agent)
+
+    assert CALLS == [("search", "rag"), ("retrieve", "other papers"), ("search", "rag")]
+
+
+def test_steps_budget_finalizes_with_one_llm_call():
+    agent = executor([("search", f"query {i}") for i in range(10)], max_steps=2, return_intermediate_steps=True)
+
+    result = run(agent)
+
+    assert len(CALLS) == 2
+    assert len(result["intermediate_steps"]) == 2
+    assert result["output"] == "finalized answer"
+
+
+def test_tokens_budget():
+    agent = executor([("long_search", f"query {i}") for i in range(10)], tools=[long_search],
+                     max_steps=10, max_scratchpad_tokens=300)
+
+    result = run(agent)
+
+    assert len(CALLS) == 1
+    assert result["output"] == "finalized answer"
+
+
+def test_time_budget_is_checked_before_each_step():
+    @tool
+    def sync_slow_search(query: str) -> str:
+        """Search slowly."""
+        CALLS.append(("sync_slow_search", query))
+        time.sleep(0.2)
+        return "results"
+
+    agent = executor([("sync_slow_search", f"query {i}") for i in range(100)], tools=[sync_slow_search],
+                     max_steps=100, max_run_seconds=0.1)
+
+    result = run(agent)
+
+    # Sync tool calls are not cut off; the overrun is noticed before the next step
+    assert len(CALLS) == 1
+    assert result["output"] == "finalized answer"
+
+
+def test_async_tool_call_is_cut_off_at_the_time_budget():
+    agent = executor([("slow_search", "rag")], tools=[slow_search], max_steps=10, max_run_seconds=0.2,
+                     return_intermediate_steps=True)
+
+    start = time.monotonic()
+    result = asyncio.run(agent.ainvoke({"input": "what is rag?"}))
+
+    assert time.monotonic() - start < 1.5
+    assert result["intermediate_steps"][0][1] == TOOL_TIMEOUT_OBSERVATION
+    assert result["output"] == "finalized answer"
+
+
+def test_last_answer_is_reused_when_the_budget_runs_out():
+    script = [("retrieve", "rag"), ("answer", "what is rag?"), ("search", "more")]
+    agent = executor(script, llm=NoLLM(responses=[]), answer_tool="answer",
+                     memo_tools=frozenset(["answer", "search"]), max_steps=4)
+
+    result = run(agent)
+
+    assert result["output"] == "answer to what is rag?"
+
+
+def test_answer_from_replaced_documents_is_not_reused():
+    script = [("retrieve", "rag"), ("answer", "what is rag?"), ("retrieve", "other papers")]
+    agent = executor(script, answer_tool="answer", memo_tools=frozenset(["answer"]), max_steps=3)
+
+    result = run(agent)
+
+    assert result["output"] == "finalized answer"
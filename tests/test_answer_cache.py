@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from answer_cache import AnswerCache, prompt_version
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(str(tmp_path / "answers.sqlite"), ttl=3600, max_entries=100)
+
+
+def key(question="What is RAG?", chunk_ids=(1, 2, 3), version=None):
+    return AnswerCache.key("gpt-test", version or prompt_version("template v1"), question, list(chunk_ids))
+
+
+def test_hit_after_store(cache):
+    cache.store(key(), "an answer", [1, 2, 3])
+
+    assert cache.lookup(key()) == "an answer"
+    assert cache.lookup(key(" What is  RAG?")) == "an answer"  # same question after normalization
+    assert cache.lookup(key(chunk_ids=(3, 2, 1))) is None  # different context order
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_no_key_without_primary_keys():
+    assert AnswerCache.key("gpt-test", "v1", "What is RAG?", [1, None]) is None
+    assert AnswerCache.key("gpt-test", "v1", "What is RAG?", []) is None
+
+
+def test_entries_expire(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl=0.1)
+    cache.store(key(), "an answer", [1, 2, 3])
+    time.sleep(0.15)
+
+    assert cache.lookup(key()) is None
+    assert cache._conn.execute("SELECT COUNT(*) FROM answer_chunks").fetchone() == (0,)
+
+
+def test_prompt_version_change_misses(cache):
+    cache.store(key(), "an answer", [1, 2, 3])
+
+    assert cache.lookup(key(version=prompt_version("template v2"))) is None
+
+
+def test_deleting_a_chunk_invalidates_answers_built_on_it(cache):
+    cache.store(key("first?", (1, 2)), "first answer", [1, 2])
+    cache.store(key("second?", (2, 3)), "second answer", [2, 3])
+    cache.store(key("third?", (4,)), "third answer", [4])
+
+    assert cache.invalidate_chunks([2]) == 2
+
+    assert cache.lookup(key("first?", (1, 2))) is None
+    assert cache.lookup(key("second?", (2, 3))) is None
+    assert cache.lookup(key("third?", (4,))) == "third answer"
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), max_entries=2)
+    cache.store(key("a?"), "a", [1, 2, 3])
+    time.sleep(0.01)
+    cache.store(key("b?"), "b", [1, 2, 3])
+    time.sleep(0.01)
+    cache.lookup(key("a?"))
+    time.sleep(0.01)
+    cache.store(key("c?"), "c", [1, 2, 3])
+
+    assert cache.lookup(key("b?")) is None
+    assert cache.lookup(key("a?")) == "a"
+    assert cache.lookup(key("c?")) == "c"
@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+from context import pack_context
+from util import count_tokens
+
+PAGE = ("Retrieval augmented generation combines a search step with a language model. "
+        "The retriever returns the chunks most similar to the question, and the model "
+        "answers from them. Chunks overlap so that sentences cut at a boundary survive. ")
+
+
+def chunk(text, source="data/a.pdf", page=0, **metadata):
+    return Document(page_content=text, metadata={"source": source, "page": page, "author": "Jane Doe",
+                                                 "title": "RAG", "pk": len(text), **metadata})
+
+
+def test_overlapping_chunks_of_one_page_are_merged():
+    first, second = PAGE[:150], PAGE[100:]
+    packed = pack_context([chunk(first), chunk(second)])
+
+    assert len(packed.sources) == 1
+    assert packed.sources[0].page_content == PAGE
+    assert packed.text.count("Source ID:") == 1
+    assert packed.text.count("Author: Jane Doe") == 1
+
+
+def test_chunk_already_covered_is_skipped():
+    packed = pack_context([chunk(PAGE), chunk(PAGE[40:120]), chunk(PAGE[:60])])
+
+    assert [doc.page_content for doc in packed.sources] == [PAGE]
+
+
+def test_same_text_on_another_page_is_not_merged():
+    packed = pack_context([chunk(PAGE, page=0), chunk(PAGE, page=3)])
+
+    assert [doc.metadata["page"] for doc in packed.sources] == [0, 3]
+
+
+def test_best_chunks_are_kept_within_the_budget():
+    docs = [chunk(f"Document {i} says something different. " + PAGE, source=f"data/{i}.pdf") for i in range(10)]
+    budget = 3 * count_tokens(docs[0].page_content) + 200
+
+    packed = pack_context(docs, budget=budget)
+
+    assert 0 < len(packed.sources) < len(docs)
+    assert packed.tokens <= budget
+    kept = [doc.metadata["source"] for doc in packed.sources]
+    assert kept == [f"data/{i}.pdf" for i in range(len(kept))]
+    assert packed.saved_tokens > 0
+
+
+def test_first_chunk_is_kept_even_over_budget():
+    packed = pack_context([chunk(PAGE)], budget=1)
+
+    assert len(packed.sources) == 1
+
+
+def test_sources_line_up_with_source_ids():
+    docs = [
+        chunk(PAGE, source="data/b.pdf", page=2, author="John Roe"),
+        chunk("An unrelated passage on the first page of the first document.", page=0),
+        chunk("Another passage, from page five of the first document.", page=5),
+    ]
+    packed = pack_context(docs)
+
+    for i, source in enumerate(packed.sources):
+        section = packed.text.split(f"Source ID: {i} (Page Number: {source.metadata['page'] + 1})\n", 1)[1]
+        assert section.startswith(source.page_content)
+        assert "pk" not in source.metadata
+    assert [(s.metadata["source"], s.metadata["page"]) for s in packed.sources] == [
+        ("data/b.pdf", 2), ("data/a.pdf", 0), ("data/a.pdf", 5)
+    ]
+    assert packed.sources[0].metadata["author"] == "John Roe"
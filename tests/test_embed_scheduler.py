@@ -0,0 +1,106 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from embed_scheduler import EmbeddingScheduler
+from util import count_tokens
+
+
+class RateLimitError(Exception):
+    """Looks like an HTTP 429 from the provider."""
+
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = types.SimpleNamespace(status_code=429, headers=headers)
+
+
+class StubEmbeddings:
+    """Embeds each text as [len(text)], records calls and concurrency, and fails as told."""
+
+    def __init__(self, failures=(), delay=0.0):
+        self.failures = list(failures)  # exceptions raised by the first calls, in order
+        self.delay = delay
+        self.calls = []  # (start time, texts)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, texts):
+        self.calls.append((time.monotonic(), list(texts)))
+        if self.failures:
+            raise self.failures.pop(0)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return [[float(len(text))] for text in texts]
+
+
+def test_pack_respects_token_budget_and_batch_size():
+    texts = [("word " * n).strip() for n in (5, 40, 3, 60, 10, 10, 10, 200, 1)]
+    scheduler = EmbeddingScheduler(StubEmbeddings(), max_batch_tokens=60, max_batch_size=3)
+
+    batches = scheduler.pack(texts)
+
+    assert [i for batch in batches for i in batch] == list(range(len(texts)))
+    for batch in batches:
+        assert len(batch) <= 3
+        # A single text over the budget still gets a batch of its own
+        if len(batch) > 1:
+            assert sum(count_tokens(texts[i]) for i in batch) <= 60
+    assert scheduler.tokens == sum(count_tokens(text) for text in texts)
+
+
+def test_embed_caps_requests_in_flight_and_keeps_order():
+    stub = StubEmbeddings(delay=0.02)
+    scheduler = EmbeddingScheduler(stub, max_batch_size=1, max_in_flight=3)
+    texts = [f"text {'x' * i}" for i in range(12)]
+
+    vectors = asyncio.run(scheduler.embed(texts))
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert stub.max_in_flight == 3
+    assert scheduler.requests == 12
+
+
+def test_rate_limit_pauses_every_request_until_retry_after():
+    stub = StubEmbeddings(failures=[RateLimitError(retry_after=0.2)], delay=0.01)
+    scheduler = EmbeddingScheduler(stub, max_batch_size=1, max_in_flight=4)
+    texts = [f"text {i}" for i in range(6)]
+
+    vectors = asyncio.run(scheduler.embed(texts))
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert scheduler.rate_limited == 1
+    assert scheduler.retries == 1
+    limited_at = stub.calls[0][0]
+    # The first call fails before any other starts; no request goes out during the pause
+    assert len(stub.calls) == 7
+    assert all(start >= limited_at + 0.19 for start, _ in stub.calls[1:])
+
+
+def test_gives_up_after_max_retries():
+    stub = StubEmbeddings(failures=[RateLimitError(retry_after=0) for _ in range(10)])
+    scheduler = EmbeddingScheduler(stub, max_retries=3)
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(scheduler.embed(["one text"]))
+
+    assert len(stub.calls) == 4  # first attempt + 3 retries
+    assert scheduler.retries == 3
+
+
+def test_other_errors_are_not_retried():
+    stub = StubEmbeddings(failures=[ValueError("bad input")])
+    scheduler = EmbeddingScheduler(stub)
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.embed(["one text"]))
+
+    assert len(stub.calls) == 1
+    assert scheduler.retries == 0
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from embedding_cache import CachedEmbeddings
+
+
+class StubEmbeddings:
+    """Embeds each text as [len(text), 1.0] and counts the texts it was asked for."""
+
+    model = "stub"
+    dimensions = 2
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(0.001)
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CachedEmbeddings(StubEmbeddings(), str(tmp_path / "embeddings.sqlite"))
+
+
+def test_hits_misses_and_duplicates(cache):
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert cache.embed_documents(["bb", " bb ", "ccc"]) == [[2.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert cache.embed_query("a") == [1.0, 1.0]
+
+    assert cache.underlying.embedded == ["a", "bb", "ccc"]
+    assert (cache.hits, cache.misses) == (4, 3)
+
+
+def test_replacing_a_key_does_not_grow_the_size(cache):
+    cache.embed_documents(["a", "bb"])
+    cache._store({cache._key("a"): [9.0, 9.0]})
+    cache._store({cache._key("a"): [8.0, 8.0], cache._key("new"): [1.0, 1.0]})
+
+    assert cache._size == cache._stored_bytes() == 3 * 8
+
+
+def test_eviction_starts_only_past_max_bytes(tmp_path):
+    cache = CachedEmbeddings(StubEmbeddings(), str(tmp_path / "embeddings.sqlite"), max_bytes=10 * 8)
+    texts = [f"text {i}" for i in range(10)]
+    cache.embed_documents(texts)
+    for _ in range(5):
+        cache._store({cache._key(text): [0.0, 0.0] for text in texts})
+
+    assert cache._stored_bytes() == 10 * 8  # full, but nothing evicted
+
+    cache.embed_documents(["one more"])
+    assert cache._stored_bytes() <= 9 * 8
+
+
+def test_counts_are_exact_under_concurrency(cache):
+    texts = [f"text {i % 20}" for i in range(50)]
+
+    def worker():
+        for text in texts:
+            cache.embed_query(text)
+
+    async def async_worker():
+        await asyncio.gather(*(cache.aembed_documents(texts[i:i + 5]) for i in range(0, 50, 5)))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    threads.append(threading.Thread(target=lambda: asyncio.run(async_worker())))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.hits + cache.misses == 5 * 50
+    assert cache._size == cache._stored_bytes() == 20 * 8
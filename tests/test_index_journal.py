@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain")
+
+import index
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(index, "MANIFEST_PATH", str(tmp_path / "index_manifest.json"))
+    monkeypatch.setattr(index, "JOURNAL_PATH", str(tmp_path / "index_journal.jsonl"))
+    return tmp_path
+
+
+def test_no_manifest():
+    assert index.load_manifest() is None
+
+
+def test_journal_is_replayed_up_to_a_torn_last_line(state_dir):
+    index.save_manifest({"fields": {}, "files": {"data/a.pdf": {"hash": "ha", "ids": [1, 2], "done": True}}})
+    journal = state_dir / "index_journal.jsonl"
+    with open(journal, "w") as f:
+        index.commit_batch({"fields": {}, "files": {}}, f, {
+            "fields": {"doc_id": "str"},
+            "added": [["data/b.pdf", "hb", [3, 4]]],
+            "done": [],
+        })
+        index.commit_batch({"fields": {}, "files": {}}, f, {
+            "added": [["data/b.pdf", "hb", [5]], ["data/c.pdf", "hc", [6]]],
+            "done": [["data/b.pdf", "hb"]],
+        })
+        f.write('{"added": [["data/c.pdf", "hc", [7')  # interrupted mid-write
+
+    manifest = index.load_manifest()
+
+    assert manifest == {
+        "fields": {"doc_id": "str"},
+        "files": {
+            "data/a.pdf": {"hash": "ha", "ids": [1, 2], "done": True},
+            "data/b.pdf": {"hash": "hb", "ids": [3, 4, 5], "done": True},
+            "data/c.pdf": {"hash": "hc", "ids": [6], "done": False},
+        },
+    }
+    # The replayed state is compacted into the manifest and the journal removed
+    assert not journal.exists()
+    with open(state_dir / "index_manifest.json") as f:
+        assert json.load(f) == manifest
+    assert index.load_manifest() == manifest
+
+
+def test_commit_batch_updates_the_manifest_in_memory_too(state_dir):
+    manifest = {"fields": {}, "files": {}}
+    with open(state_dir / "index_journal.jsonl", "w") as f:
+        index.commit_batch(manifest, f, {"added": [["data/a.pdf", "ha", [1]]], "done": [["data/a.pdf", "ha"]]})
+
+    assert manifest["files"] == {"data/a.pdf": {"hash": "ha", "ids": [1], "done": True}}
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from lazy import LazySingleton
+
+
+class Client:
+    """Fails the first `failures` calls of each method with a dropped connection."""
+
+    created = 0
+
+    def __init__(self, failures):
+        Client.created += 1
+        self.failures = failures
+        self.calls = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        if len(self.calls) <= self.failures:
+            raise ConnectionError("connection dropped")
+        return name
+
+    def search(self):
+        return self._call("search")
+
+    def insert(self):
+        return self._call("insert")
+
+    async def asearch(self):
+        return self._call("asearch")
+
+
+@pytest.fixture
+def singleton():
+    Client.created = 0
+    # Only the first connection drops
+    return LazySingleton("client", lambda: Client(failures=1 if Client.created == 0 else 0),
+                         should_reconnect=lambda e: isinstance(e, ConnectionError),
+                         retry_methods={"search", "asearch"})
+
+
+def test_created_once_on_first_use(singleton):
+    assert Client.created == 0
+    singleton.get()
+    singleton.get()
+    assert Client.created == 1
+
+
+def test_read_is_retried_on_a_fresh_instance(singleton):
+    first = singleton.get()
+
+    assert singleton.search() == "search"
+    assert singleton.get() is not first
+    assert Client.created == 2
+
+
+def test_async_read_is_retried(singleton):
+    assert asyncio.run(singleton.asearch()) == "asearch"
+    assert Client.created == 2
+
+
+def test_write_is_not_retried_but_reconnects_next_time(singleton):
+    first = singleton.get()
+
+    with pytest.raises(ConnectionError):
+        singleton.insert()
+    assert first.calls == ["insert"]
+    assert singleton.get() is not first
+
+
+def test_other_errors_keep_the_instance(singleton):
+    first = singleton.get()
+    first.failures = 0
+    first.search = lambda: 1 / 0
+
+    with pytest.raises(ZeroDivisionError):
+        singleton.search()
+    assert singleton.get() is first
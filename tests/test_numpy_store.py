@@ -0,0 +1,146 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+from numpy_store import NumpyVectorStore, compress
+
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def add(store, vectors, doc_id="doc"):
+    return store.add_embeddings(
+        texts=[f"chunk {i}" for i in range(len(vectors))],
+        embeddings=vectors.tolist(),
+        metadatas=[{"doc_id": doc_id, "i": i} for i in range(len(vectors))],
+    )
+
+
+def top_pk(store, vector, k=1, **kwargs):
+    return [doc.metadata["pk"] for doc in store.similarity_search_by_vector(vector.tolist(), k=k, **kwargs)]
+
+
+def test_add_search_delete_and_reopen(tmp_path):
+    vectors = random_vectors(20)
+    store = NumpyVectorStore(None, str(tmp_path))
+    ids = add(store, vectors)
+
+    assert len(set(ids)) == 20
+    assert top_pk(store, vectors[3]) == [ids[3]]
+    doc = store.similarity_search_by_vector(vectors[3].tolist(), k=1)[0]
+    assert doc.page_content == "chunk 3" and doc.metadata["i"] == 3
+
+    store.delete(ids=[ids[3], ids[7]])
+    for vector in vectors:
+        assert not {ids[3], ids[7]} & set(top_pk(store, vector, k=20))
+    assert len(top_pk(store, vectors[0], k=50)) == 18
+
+    reopened = NumpyVectorStore(None, str(tmp_path))
+    assert (reopened.dim, reopened.count, reopened.capacity) == (16, 20, store.capacity)
+    assert top_pk(reopened, vectors[5]) == [ids[5]]
+    assert ids[3] not in top_pk(reopened, vectors[3], k=20)
+
+
+def test_reader_picks_up_rows_added_by_another_instance(tmp_path):
+    vectors = random_vectors(10)
+    reader = NumpyVectorStore(None, str(tmp_path))
+    writer = NumpyVectorStore(None, str(tmp_path))
+    ids = add(writer, vectors)
+
+    assert top_pk(reader, vectors[4]) == [ids[4]]
+
+
+def test_growing_past_capacity_keeps_existing_rows(tmp_path):
+    vectors = random_vectors(1500)
+    store = NumpyVectorStore(None, str(tmp_path))
+    first = add(store, vectors[:1000])
+    second = add(store, vectors[1000:])
+
+    assert store.capacity == 2048
+    assert top_pk(store, vectors[10]) == [first[10]]
+    assert top_pk(store, vectors[1200]) == [second[200]]
+
+
+def test_compact_reclaims_deleted_rows_and_keeps_primary_keys(tmp_path):
+    vectors = random_vectors(30)
+    store = NumpyVectorStore(None, str(tmp_path))
+    ids = add(store, vectors[:20], doc_id="old")
+    ids += add(store, vectors[20:], doc_id="new")
+    dead = ids[:15]
+    store.delete(ids=dead)
+
+    assert store.compact(min_dead_fraction=0.9) == 0
+    assert store.compact(min_dead_fraction=0.1) == 15
+    assert store.count == 15
+    assert store.compact() == 0
+
+    for i in range(15, 30):
+        assert top_pk(store, vectors[i]) == [ids[i]]
+    assert top_pk(store, vectors[25], doc_ids=["new"]) == [ids[25]]
+    assert not set(dead) & set(top_pk(store, vectors[0], k=30))
+
+    reopened = NumpyVectorStore(None, str(tmp_path))
+    assert reopened.count == 15
+    assert top_pk(reopened, vectors[16]) == [ids[16]]
+    more = add(reopened, vectors[:1])
+    assert more[0] > max(ids)
+    assert top_pk(reopened, vectors[0]) == more
+
+
+def exact_top_k(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:k])
+
+
+def test_int8_compression_round_trips_through_the_scales(tmp_path):
+    vectors = random_vectors(50, dim=32)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    quantized, scales = compress(normalized, 32, "int8")
+
+    assert quantized.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(quantized).max() == 127
+    assert np.allclose(quantized * scales[:, None], normalized, atol=scales.max() / 2 + 1e-6)
+
+    store = NumpyVectorStore(None, str(tmp_path), quantization="int8")
+    add(store, vectors)
+    reopened = NumpyVectorStore(None, str(tmp_path))
+    assert reopened.quantization == "int8" and reopened.search_dim == 32
+    assert np.array_equal(reopened._search[:50], quantized)
+    assert np.array_equal(reopened._scales[:50], scales)
+
+
+def test_truncation_renormalizes_the_prefix():
+    vectors = random_vectors(10, dim=32)
+    truncated, scales = compress(vectors, 8, "float16")
+
+    assert scales is None and truncated.shape == (10, 8) and truncated.dtype == np.float16
+    assert np.allclose(np.linalg.norm(truncated.astype(np.float32), axis=1), 1, atol=1e-3)
+
+
+@pytest.mark.parametrize("search_dim,quantization", [(None, "int8"), (None, "float16"), (48, "int8")])
+def test_rerank_returns_the_exact_top_k(tmp_path, search_dim, quantization):
+    # Matryoshka-like: most of the signal sits in the leading components
+    rng = np.random.default_rng(1)
+    weights = np.where(np.arange(64) < 48, 1.0, 0.2).astype(np.float32)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32) * weights
+    store = NumpyVectorStore(None, str(tmp_path), search_dim=search_dim, quantization=quantization, rerank_factor=8)
+    ids = add(store, vectors)
+
+    for query in rng.standard_normal((20, 64)).astype(np.float32) * weights:
+        expected = [ids[i] for i in exact_top_k(vectors, query, 5)]
+        assert top_pk(store, query, k=5) == expected
+
+
+def test_compact_keeps_the_compressed_copy_aligned(tmp_path):
+    vectors = random_vectors(40, dim=32)
+    store = NumpyVectorStore(None, str(tmp_path), search_dim=16, quantization="int8", rerank_factor=2)
+    ids = add(store, vectors)
+    store.delete(ids=ids[::2])
+
+    assert store.compact() == 20
+    expected, scales = compress(store._vectors[:20], 16, "int8")
+    assert np.array_equal(store._search[:20], expected)
+    assert np.array_equal(store._scales[:20], scales)
+    assert top_pk(store, vectors[5]) == [ids[5]]
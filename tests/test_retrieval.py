@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+from retrieval import split_queries
+
+
+def test_split_json_list():
+    assert split_queries('["what is RAG?", " chunk size; overlap ", ""]') == ["what is RAG?", "chunk size; overlap"]
+
+
+def test_split_lines():
+    assert split_queries("what is RAG?\n\n  how are chunks scored?\n") == ["what is RAG?", "how are chunks scored?"]
+
+
+def test_split_pipes():
+    assert split_queries("BM25 recall | dense recall |") == ["BM25 recall", "dense recall"]
+
+
+def test_semicolons_and_quotes_are_kept():
+    assert split_queries('effect of "chunk size"; does overlap matter') == ['effect of "chunk size"; does overlap matter']
+    assert split_queries('"attention is all you need" | "BERT"') == ['"attention is all you need"', '"BERT"']
+
+
+def test_invalid_json_falls_back_to_plain_text():
+    assert split_queries("[draft] RAG survey | evaluation") == ["[draft] RAG survey", "evaluation"]
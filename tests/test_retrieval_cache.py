@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+import util
+from retrieval import RetrievalCache, unit
+
+
+@pytest.fixture(autouse=True)
+def index_version_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(util, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(util, "INDEX_VERSION_PATH", str(tmp_path / "index_version"))
+
+
+def docs(name):
+    return [Document(page_content=name)]
+
+
+def put(cache, query, vector, scope=""):
+    cache.put(query, 5, unit(vector), docs(query), (0.1, 0.2), scope)
+
+
+def test_exact_hit_after_put():
+    cache = RetrievalCache(max_entries=4)
+    put(cache, "what is rag", [1, 0, 0])
+
+    assert cache.get_exact("what is rag", 5)[0].page_content == "what is rag"
+    assert cache.get_exact("what is rag", 3) is None
+    assert cache.get_exact("something else", 5) is None
+    assert cache.hits_exact == 1
+
+
+def test_semantic_hit_only_above_threshold():
+    cache = RetrievalCache(max_entries=4, threshold=0.95)
+    put(cache, "what is rag", [1, 0, 0])
+
+    close = unit([1, 0.1, 0])  # cosine ~0.995
+    far = unit([1, 1, 0])  # cosine ~0.707
+    assert cache.get_semantic(close, 5)[0].page_content == "what is rag"
+    assert cache.get_semantic(far, 5) is None
+    assert cache.hits_semantic == 1
+
+
+def test_expired_best_match_falls_back_to_next_valid_entry():
+    cache = RetrievalCache(max_entries=4, ttl=0.1, threshold=0.9)
+    put(cache, "old", [1, 0, 0])
+    time.sleep(0.15)
+    put(cache, "fresh", [1, 0.2, 0])
+
+    # "old" is the closer match but has expired
+    assert cache.get_semantic(unit([1, 0.01, 0]), 5)[0].page_content == "fresh"
+    assert cache.get_exact("old", 5) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_bumping_the_index_version_drops_everything():
+    cache = RetrievalCache(max_entries=4)
+    put(cache, "what is rag", [1, 0, 0])
+
+    util.bump_index_version()
+
+    assert cache.get_exact("what is rag", 5) is None
+    assert cache.get_semantic(unit([1, 0, 0]), 5) is None
+
+
+def test_scopes_are_kept_apart():
+    cache = RetrievalCache(max_entries=4)
+    survey = '[["survey.pdf"], [], null, null]'
+    cache.put("what is rag", 5, unit([1, 0, 0]), docs("unfiltered"), (0, 0), "")
+    cache.put("what is rag", 5, unit([1, 0, 0]), docs("survey only"), (0, 0), survey)
+
+    assert cache.get_exact("what is rag", 5)[0].page_content == "unfiltered"
+    assert cache.get_exact("what is rag", 5, survey)[0].page_content == "survey only"
+    assert cache.get_semantic(unit([1, 0, 0]), 5, survey)[0].page_content == "survey only"
+    assert cache.get_semantic(unit([1, 0, 0]), 5, '[["other.pdf"], [], null, null]') is None
@@ -0,0 +1,90 @@
+import types
+
+import pytest
+
+import search_filter
+from search_filter import SearchFilter, parse_filters
+
+DOCUMENTS = {
+    "d1": {"source": "data/survey.pdf", "author": "Jane Doe; John Roe", "creationdate": "2019-05-01T00:00:00"},
+    "d2": {"source": "data/rag.pdf", "author": "John Roe", "creationdate": "D:20210101000000Z"},
+    "d3": {"source": "data/old.pdf", "author": "Ann Smith", "creationdate": ""},
+}
+
+
+@pytest.fixture(autouse=True)
+def documents(monkeypatch):
+    monkeypatch.setattr(search_filter, "DOC_STORE", types.SimpleNamespace(all=lambda: DOCUMENTS))
+
+
+def test_no_filters():
+    question, filters = parse_filters("  what is  measured? ")
+
+    assert question == "what is measured?"
+    assert not filters and filters.key() == ""
+
+
+def test_quoted_author_and_source():
+    question, filters = parse_filters('what is measured? author:"Jane Doe" source:Survey.pdf')
+
+    assert question == "what is measured?"
+    assert filters == SearchFilter(("survey.pdf",), ("jane doe",))
+    assert filters.doc_ids() == ["d1"]
+
+
+@pytest.mark.parametrize("text,year_from,year_to,doc_ids", [
+    ("year:2019", 2019, 2019, ["d1"]),
+    ("year:2019-2021", 2019, 2021, ["d1", "d2"]),
+    ("year:2020-", 2020, None, ["d2"]),
+    ("year:-2020", None, 2020, ["d1"]),
+])
+def test_year_ranges(text, year_from, year_to, doc_ids):
+    question, filters = parse_filters(f"rag {text}")
+
+    assert question == "rag"
+    assert (filters.year_from, filters.year_to) == (year_from, year_to)
+    assert filters.doc_ids() == doc_ids  # d3 has no year and never matches a year filter
+
+
+@pytest.mark.parametrize("text", ["what happened in year:last", "year:20190 results", "source: rag"])
+def test_values_that_are_not_filters_stay_in_the_question(text):
+    question, filters = parse_filters(text)
+
+    assert question == " ".join(text.split())
+    assert not filters
+
+
+def test_repeated_sources_are_ored():
+    _, filters = parse_filters("compare source:survey source:rag.pdf")
+
+    assert filters.sources == ("survey", "rag.pdf")
+    assert filters.doc_ids() == ["d1", "d2"]
+
+
+def test_author_matches_a_substring_of_the_author_list():
+    assert parse_filters("author:roe")[1].doc_ids() == ["d1", "d2"]
+
+
+def test_merged_keeps_both_lists_and_the_narrower_years():
+    _, base = parse_filters("source:survey year:2015-2021")
+    _, inline = parse_filters("author:doe year:2019-")
+
+    merged = base.merged(inline)
+
+    assert merged == SearchFilter(("survey",), ("doe",), 2019, 2021)
+    assert merged.key() == base.merged(inline).key() != base.key()
+
+
+def test_search_with_no_matching_documents_skips_the_store(monkeypatch):
+    pytest.importorskip("numpy")
+    pytest.importorskip("langchain_core")
+    import retrieval
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("the vector store was not expected to be searched")
+
+    monkeypatch.setattr(retrieval, "VECTOR_STORE", types.SimpleNamespace(similarity_search_by_vector=unexpected))
+    monkeypatch.setattr(retrieval, "EMBEDDINGS", types.SimpleNamespace(embed_query=unexpected))
+    _, filters = parse_filters("author:nobody")
+
+    assert retrieval.search("what is measured?", filters=filters) == []
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from session_state import SessionStore
+
+
+def test_sessions_keep_separate_current_documents():
+    store = SessionStore()
+    alice, bob = store.get("alice"), store.get("bob")
+    alice.current = alice.add("what is rag", None, "alice's documents")
+    bob.current = bob.add("what is rag", None, "bob's documents")
+
+    assert store.get("alice").current.value == "alice's documents"
+    assert store.get("bob").current.value == "bob's documents"
+    assert store.get("alice").find_exact("what is rag").value == "alice's documents"
+
+
+def test_dropping_a_session_leaves_the_others_untouched():
+    store = SessionStore()
+    store.get("alice").current = store.get("alice").add("q", None, "alice's documents")
+    store.get("bob").current = store.get("bob").add("q", None, "bob's documents")
+
+    store.drop("alice")
+    store.drop("nobody")
+
+    assert len(store) == 1
+    assert store.get("bob").current.value == "bob's documents"
+    assert store.get("alice").current is None
+
+
+def test_least_recently_used_and_idle_sessions_are_evicted():
+    store = SessionStore(max_sessions=2, idle_ttl=0.1)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+
+    assert set(store._sessions) == {"a", "c"}
+    time.sleep(0.15)
+    store.get("d")
+    assert set(store._sessions) == {"d"}
+
+
+def test_find_similar_uses_the_threshold():
+    session = SessionStore().get("alice")
+    session.add("what is rag", np.array([1.0, 0.0]), "rag documents")
+
+    assert session.find_similar(np.array([0.99, 0.141]), 0.95).value == "rag documents"
+    assert session.find_similar(np.array([0.0, 1.0]), 0.95) is None
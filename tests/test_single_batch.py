@@ -0,0 +1,86 @@
+import asyncio
+import json
+import types
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+import single
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_read_questions_keeps_falsy_ids(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    write_jsonl(path, [
+        {"id": 1, "question": "first?"},
+        {"id": 0, "question": "zero?"},
+        {"question": "no id?"},
+        {"id": "x", "question": "  "},
+    ])
+
+    assert list(single.read_questions(str(path))) == [("1", "first?"), ("0", "zero?"), ("2", "no id?")]
+
+
+def test_read_questions_from_csv(tmp_path):
+    path = tmp_path / "questions.csv"
+    path.write_text("qid,text\na,What is RAG?\n,Empty id?\n")
+
+    assert list(single.read_questions(str(path), "text", "qid")) == [("a", "What is RAG?"), ("", "Empty id?")]
+
+
+def test_resumed_run_retries_failures_and_keeps_one_record_per_id(tmp_path, monkeypatch):
+    questions = tmp_path / "questions.jsonl"
+    output = tmp_path / "answers.jsonl"
+    write_jsonl(questions, [{"id": i, "question": f"question {i}?"} for i in range(4)])
+    attempts = {}
+
+    async def answer_item(item_id, question, embedding, embed_seconds, filters=None):
+        attempts[item_id] = attempts.get(item_id, 0) + 1
+        if item_id == "2" and attempts[item_id] == 1:
+            return {"id": item_id, "question": question, "error": "RuntimeError: boom"}
+        return {"id": item_id, "question": question, "answer": f"answer {item_id}"}
+
+    async def aembed_documents(texts):
+        return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(single, "answer_item", answer_item)
+    monkeypatch.setattr(single, "EMBEDDINGS", types.SimpleNamespace(aembed_documents=aembed_documents))
+
+    counts = asyncio.run(single.run_batch(str(questions), str(output), concurrency=2))
+    assert counts == {"answered": 3, "failed": 1, "skipped": 0}
+    with open(output, "a") as f:
+        f.write('{"id": "3", "answ')  # interrupted mid-write
+
+    counts = asyncio.run(single.run_batch(str(questions), str(output), concurrency=2))
+    assert counts == {"answered": 1, "failed": 0, "skipped": 3}
+    records = read_jsonl(output)
+    assert sorted(record["id"] for record in records) == ["0", "1", "2", "3"]
+    assert all("error" not in record for record in records)
+    assert attempts == {"0": 1, "1": 1, "2": 2, "3": 1}
+
+
+def test_answer_item_lists_the_retrieved_chunks(monkeypatch):
+    doc = types.SimpleNamespace(metadata={"source": "data/a.pdf", "page": 3, "pk": 42})
+
+    async def asearch(query, k=5, embedding=None, filters=None):
+        return [doc]
+
+    async def generate(state):
+        return {"answer": "an answer"}
+
+    monkeypatch.setattr(single, "asearch", asearch)
+    monkeypatch.setattr(single, "generate", generate)
+
+    record = asyncio.run(single.answer_item("q1", "what is rag?", [1.0], 0.01))
+
+    assert record["answer"] == "an answer"
+    assert record["retrieved"] == [{"source": "data/a.pdf", "page": 3, "pk": 42}]
+    assert "citations" not in record
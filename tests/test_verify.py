@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+from verify import QuoteVerifier, format_citations, quote_segments
+
+DOCS = [
+    Document(
+        page_content="Retrieval quality depends on chunking. Smaller chunks improve precision, "
+        "but they lose context that larger chunks keep.",
+        metadata={"author": "Jane Doe", "creationdate": "2019-05-01T00:00:00", "page": 2},
+    ),
+    Document(
+        page_content="The index is rebuilt nightly; in practice, most queries hit the warm cache.",
+        metadata={"author": "John Roe", "creationdate": "D:20210101000000Z", "page": 0},
+    ),
+]
+
+
+def citation(quote, source_id):
+    return types.SimpleNamespace(quote=quote, source_id=source_id)
+
+
+def test_exact_quote_is_verified_in_the_cited_source():
+    quote = "Smaller chunks improve precision"
+    match = QuoteVerifier().verify(quote, DOCS, source_id=0)
+
+    assert match.verified and match.source_id == 0
+    start, end = match.span
+    assert DOCS[0].page_content[start:end] == quote
+
+
+def test_whitespace_case_and_punctuation_differences_are_ignored():
+    quote = "smaller   CHUNKS improve precision... they lose context!"
+    match = QuoteVerifier().verify(quote, DOCS, source_id=0)
+
+    assert match.verified and match.source_id == 0
+    assert quote_segments(quote) == [["smaller", "chunks", "improve", "precision"], ["they", "lose", "context"]]
+
+
+def test_quote_from_another_source_is_reattributed():
+    match = QuoteVerifier().verify("most queries hit the warm cache", DOCS, source_id=0)
+
+    assert match.verified and match.source_id == 1
+
+
+def test_fabricated_quote_is_dropped():
+    verifier = QuoteVerifier()
+    citations = [
+        citation("Larger chunks always improve precision", 0),
+        citation("The index is rebuilt nightly", 1),
+    ]
+
+    matches = verifier.verify_citations(citations, DOCS)
+    assert [m.verified for m in matches] == [False, True]
+
+    text = format_citations(citations, DOCS, verifier)
+    assert "Larger chunks" not in text
+    assert text == '\n\n**Citations:**\nQuote 1: "The index is rebuilt nightly" (John Roe, 2021, p. 1)\n\n'
+
+
+def test_reattributed_quote_is_cited_with_the_source_it_was_found_in():
+    text = format_citations([citation("Retrieval quality depends on chunking", 1)], DOCS, QuoteVerifier())
+
+    assert "(Jane Doe, 2019, p. 3)" in text
+
+
+def test_no_citations_header_without_verified_quotes():
+    verifier = QuoteVerifier()
+
+    assert format_citations([], DOCS, verifier) == ""
+    assert format_citations([citation("nothing like this was written", 0)], DOCS, verifier) == ""